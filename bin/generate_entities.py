@@ -1,5 +1,6 @@
 import sys
-import json
+from dataengineer_toolkit.dbprofiler.store import select_tables
+from dataengineer_toolkit.job_generator.typemap import java_type, hive_type
 
 properties = {
     'resourceManager': 'hdpmaster1.tm.com.my:8050',
@@ -18,7 +19,8 @@ properties = {
     'user.name': 'trace',
     'mapreduce.job.user.name': 'trace',
     'jobTracker': 'hdpmaster1.tm.com.my:8050',
-    'columns': None
+    'columns': None,
+    'columns_java': None
 }
 
 template = '''
@@ -45,52 +47,45 @@ template = '''
 </process>
 '''
 
-TYPE_MAP = {
-    'VARCHAR2': 'STRING',
-    'DATE': 'STRING',
-    'NUMBER': 'FLOAT',
-    'CHAR': 'STRING',
-    'LONG': 'BIGINT',
-    'CLOB': 'BINARY',
-    'RAW': 'BINARY'
-}
-
-for ds in json.loads(open(sys.argv[1]).read()):
-    for table in ds['tables']:
-        mapper = int((table['estimated_size'] or 0) / 1024 / 1024 / 1024) or 2
-        if mapper > 20:
-            mapper = 20
-        columns = ['`SQOOP_ORACLE_ROWID` STRING']
-        for c in table['columns']:
-            columns.append('`%s` %s' % (c['field'] , TYPE_MAP[c['type']]))
-        properties['jdbc_uri'] = 'jdbc:oracle:thin:@%(host)s:%(port)s/%(tns)s' % {
-             'host': ds['datasource']['ip'],
-             'port': ds['datasource']['port'],
-             'tns': ds['datasource']['tns'],
-            
-        }
-        properties.update({
-            'mapper': int((table['estimated_size'] or 0) / 1024 / 1024 / 1024) or 1,
-            'source_name': ds['datasource']['name'].replace(' ','_'),
-            'username': ds['datasource']['login'],
-            'password': ds['datasource']['password'],
-            'schema': ds['datasource']['schema'],
-            'table': table['table'],
-            'split_by': table['split_by'],
-            'columns': ', '.join(columns)
-        })
+for ds, table in select_tables(sys.argv[1]):
+    mapper = int((table['estimated_size'] or 0) / 1024 / 1024 / 1024) or 2
+    if mapper > 20:
+        mapper = 20
+    columns = ['`SQOOP_ORACLE_ROWID` STRING']
+    columns_java = []
+    for c in table['columns']:
+        columns.append('`%s` %s' % (c['field'], hive_type(c)))
+        if java_type(c) is not None:
+            columns_java.append('%s=%s' % (c['field'], java_type(c)))
+    properties['jdbc_uri'] = 'jdbc:oracle:thin:@%(host)s:%(port)s/%(tns)s' % {
+         'host': ds['datasource']['ip'],
+         'port': ds['datasource']['port'],
+         'tns': ds['datasource']['tns'],
+        
+    }
+    properties.update({
+        'mapper': int((table['estimated_size'] or 0) / 1024 / 1024 / 1024) or 1,
+        'source_name': ds['datasource']['name'].replace(' ','_'),
+        'username': ds['datasource']['login'],
+        'password': ds['datasource']['password'],
+        'schema': ds['datasource']['schema'],
+        'table': table['table'],
+        'split_by': table['split_by'],
+        'columns': ', '.join(columns),
+        'columns_java': ','.join(columns_java)
+    })
 
-        params = {
-            'schema': ds['datasource']['schema'],
-            'table': table['table'],
-            'ingest_type': 'full',
-            'source_name': properties['source_name'],
-            'start_utc': '2017-01-01T00:00Z',
-            'should_end_hours': 5,
-            'frequency_hours': 24,
-            'properties': '\n       '.join(
-                ['<property name="%s" value="%s"/>' % (k,v) for (k,v) in properties.items()])
-        }
-        job = template % params
-        with open('entities/process-%(source_name)s-%(schema)s-%(table)s.xml' % params, 'w') as f:
-            f.write(job)
+    params = {
+        'schema': ds['datasource']['schema'],
+        'table': table['table'],
+        'ingest_type': 'full',
+        'source_name': properties['source_name'],
+        'start_utc': '2017-01-01T00:00Z',
+        'should_end_hours': 5,
+        'frequency_hours': 24,
+        'properties': '\n       '.join(
+            ['<property name="%s" value="%s"/>' % (k,v) for (k,v) in properties.items()])
+    }
+    job = template % params
+    with open('entities/process-%(source_name)s-%(schema)s-%(table)s.xml' % params, 'w') as f:
+        f.write(job)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# Benchmark the per table rendering of the job generator on synthetic
+# profiles, so that generator changes can be compared before and after.
+#
+# Every table is rendered twice into a scratch directory: a first run
+# writing all artifacts, and a rerun where the manifest finds them all
+# unchanged, which leaves the rendering itself. The config has two stages,
+# the ingest and transform processes and a parquet and a hive feed, as the
+# sample generator.cfg.
+#
+# With --baseline, the tables are also rendered the way the generator did
+# before the stages shared a render context: a copy of the table properties
+# per process and feed, oozie_config() worked out by both the oozie
+# properties and the falcon process, feed names derived by every entity
+# and the schedule times parsed for every entity. Both routes write the
+# same artifacts.
+#
+# usage:
+#    generator_benchmark.py [--tables 1000] [--columns 30] [--baseline]
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from ConfigParser import ConfigParser
+from dateutil.parser import parse as parse_date
+
+from dataengineer_toolkit.job_generator import generator
+from dataengineer_toolkit.job_generator.manifest import Manifest
+
+STAGES = {
+    'dev': {'prefix': '/user/trace/development',
+            'targetdb': 'dev_{source_name}'},
+    'prod': {'prefix': '/user/trace/production',
+             'targetdb': '{source_name}'},
+}
+
+PROCESSES = {
+    'ingest-full': {'workflow': 'ingest-full', 'out_feeds': ['rawdata']},
+    'transform-full': {'workflow': 'transform-full',
+                       'in_feeds': ['rawdata'], 'out_feeds': ['hive']},
+}
+
+FEEDS = {
+    'rawdata': {'path': '{prefix}/source/{source_name}/{schema}_{table}'
+                        '/CURRENT',
+                'format': 'parquet', 'exec_time': '00:00'},
+}
+
+HIVE_FEEDS = {
+    'hive': {'path': 'catalog:{targetdb}:{schema}_{table}'
+                     '#ingest_date=${{YEAR}}-${{MONTH}}-${{DAY}}',
+             'format': 'orc', 'exec_time': '00:00'},
+}
+
+
+def profiles(tables, columns):
+    ds = {
+        'datasource': {'name': 'BENCH', 'ip': 'localhost', 'port': 1521,
+                       'tns': 'BENCH', 'schema': 'BENCH',
+                       'login': 'bench', 'password': 'bench'},
+        'direct': True,
+        'dialect': 'oracle'
+    }
+    for t in range(tables):
+        cols = [{'field': 'ID', 'type': 'NUMBER', 'id': 1,
+                 'precision': 18, 'scale': 0},
+                {'field': 'LAST_UPD', 'type': 'DATE', 'id': 2}]
+        cols += [{'field': 'C%02d' % c, 'type': 'VARCHAR2', 'id': c + 3}
+                 for c in range(columns - 2)]
+        yield ds, {
+            'table': 'T%06d' % t, 'columns': cols,
+            'split_by': 'ID', 'merge_key': 'ID', 'check_column': 'LAST_UPD',
+            'num_rows': 1000000, 'estimated_size': 256 * 1024 * 1024,
+            'avg_row_len': 256, 'partitioning': None
+        }
+
+
+def baseline_utc_time(t, dayoffset=0):
+    day = generator._start_date or datetime.now()
+    tt = (day + timedelta(days=dayoffset)).strftime('%Y-%m-%d')
+    dt = tt + ' %s' % t
+    start_dt = parse_date(dt)
+    return (start_dt - timedelta(hours=8)).strftime('%Y-%m-%dT%H:%MZ')
+
+
+def render_baseline(ctx, ds, table):
+    # render_table() as it was before stage_context(), for table level
+    # jobs, which is all the benchmark config has
+    plan_rows, params, partition_groups = generator.table_params(
+        ctx, ds, table)
+    hive_create = []
+    artifacts = generator.ARTIFACTS
+    for stage, conf in ctx['stages'].items():
+
+        if stage in ['prod']:
+            opts = params.copy()
+            opts['targetdb'] = conf['targetdb'].format(**params)
+            opts['prefix'] = conf['prefix']
+            hive_create.append(
+                generator.hive_create_template.render(**opts)
+            )
+
+        for process, proc_opts in ctx['processes'].items():
+            opts = params.copy()
+            opts['prefix'] = conf['prefix']
+            opts['targetdb'] = conf['targetdb'].format(**params)
+
+            wf = proc_opts['workflow']
+            opts['workflow'] = wf
+            opts['wfpath'] = os.path.join(conf['prefix'], 'workflows', wf)
+            if not proc_opts.get('condition', lambda x: True):
+                continue
+
+            storedir = '%s/%s-oozie-%s' % (artifacts, stage, wf)
+            generator.write_oozie_config(storedir, opts)
+            storedir = '%s/%s-falconprocess-%s' % (artifacts, stage, wf)
+            generator.write_falcon_process(storedir, stage, opts,
+                proc_opts.get('in_feeds', []),
+                proc_opts.get('out_feeds', []),
+                generator.get_exec_time(opts['source_name'], process,
+                                        ctx['schedules'])
+            )
+
+        for feed, feed_opts in ctx['feeds'].items():
+            opts = params.copy()
+            opts['prefix'] = conf['prefix']
+            storedir = '%s/%s-falconfeed-%s' % (artifacts, stage, feed)
+            generator.write_falcon_feed(storedir, stage, opts, feed,
+                            feed_opts['path'], feed_opts['format'],
+                            feed_opts['exec_time'],
+                            feed_opts.get('retention', generator.FOREVER))
+
+        for feed, feed_opts in ctx['hive_feeds'].items():
+            opts = params.copy()
+            opts['prefix'] = conf['prefix']
+            opts['targetdb'] = conf['targetdb'].format(**params)
+            storedir = '%s/%s-falconfeed-%s' % (artifacts, stage, feed)
+            generator.write_falcon_hivefeed(storedir, stage, opts, feed,
+                            feed_opts['path'], feed_opts['format'],
+                            feed_opts['exec_time'],
+                            feed_opts.get('retention', generator.FOREVER))
+    return plan_rows, hive_create
+
+
+def render(context, tables, columns, render_table):
+    start = time.time()
+    for ds, table in profiles(tables, columns):
+        render_table(context, ds, table)
+    return time.time() - start
+
+
+def benchmark(context, tables, columns, render_table):
+    # a write run and an unchanged rerun, in a scratch directory. Returns
+    # their seconds and the artifacts of the rerun.
+    workdir = tempfile.mkdtemp(prefix='generator-benchmark')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        generator._start_date = datetime(2020, 1, 1)
+        generator._manifest = Manifest(generator.ARTIFACTS)
+        written = render(context, tables, columns, render_table)
+        generator._manifest.save()
+        generator._manifest = Manifest(generator.ARTIFACTS)
+        rerun = render(context, tables, columns, render_table)
+        artifacts = generator._manifest.current
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    return written, rerun, artifacts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=(
+        'Benchmark the job generator rendering on synthetic profiles'))
+    parser.add_argument('-n', '--tables', type=int, default=1000,
+                        help='Number of tables to render')
+    parser.add_argument('--columns', type=int, default=30,
+                        help='Columns per table')
+    parser.add_argument('--baseline', action='store_true',
+                        help=('Also render the tables without the shared '
+                              'render context'))
+    args = parser.parse_args()
+
+    context = {
+        # no throughput sections, the planner defaults
+        'cfg': ConfigParser(),
+        'stages': STAGES,
+        'processes': PROCESSES,
+        'feeds': FEEDS,
+        'hive_feeds': HIVE_FEEDS,
+        'schedules': {},
+        'partitioning': {'mode': 'table'},
+        'throughputs': {},
+    }
+
+    runs = []
+    if args.baseline:
+        utc_time = generator.generate_utc_time
+        generator.generate_utc_time = baseline_utc_time
+        try:
+            written, rerun, baseline = benchmark(
+                context, args.tables, args.columns, render_baseline)
+        finally:
+            generator.generate_utc_time = utc_time
+        runs += [('baseline write', written),
+                 ('baseline unchanged', rerun)]
+    written, rerun, artifacts = benchmark(
+        context, args.tables, args.columns, generator.render_table)
+    runs += [('write', written), ('unchanged', rerun)]
+
+    print '%d tables, %d columns, %d artifacts' % (
+        args.tables, args.columns, len(artifacts))
+    if args.baseline and baseline != artifacts:
+        print 'WARNING: the baseline artifacts differ'
+    print '%-20s%-14s%-14s' % ('run', 'seconds', 'ms/table')
+    for name, seconds in runs:
+        print '%-20s%-14.2f%-14.3f' % (name, seconds,
+                                       seconds * 1000 / args.tables)
+
+
+if __name__ == '__main__':
+    main()
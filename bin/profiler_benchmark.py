@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Benchmark OracleProfiler against synthetic catalogs served by the SQLite
+# backed fake cx_Oracle in dataengineer_toolkit.dbprofiler.fakeora, so that
+# profiler changes can be compared before and after without a database.
+#
+# Every catalog size runs in a child process of its own, to get a clean
+# peak RSS reading. Catalogs are built once and kept in --workdir.
+#
+# usage:
+#    profiler_benchmark.py [--tables 100 1000 20000] [--latency 1]
+#                          [--bulk] [--sessions 4] [--column-stats]
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+import tempfile
+
+from dataengineer_toolkit.dbprofiler import fakeora
+
+try:
+    import cx_Oracle
+except ImportError:
+    # the profiler imports cx_Oracle at module level, the fake stands in
+    sys.modules['cx_Oracle'] = fakeora
+
+from dataengineer_toolkit.dbprofiler import oracle
+
+OWNER = 'BENCH'
+
+# rows per table when the sampling queries are benchmarked as well
+DATA_ROWS = 50
+
+
+def catalog_path(workdir, tables, data):
+    path = os.path.join(workdir, 'catalog-%d%s.db' % (
+        tables, '-data' if data else ''))
+    if not os.path.exists(path):
+        fakeora.build_catalog(path + '.tmp', tables, OWNER,
+                              data_rows=DATA_ROWS if data else 0)
+        if data:
+            os.rename('%s.tmp.%s' % (path, OWNER),
+                      '%s.%s' % (path, OWNER))
+        os.rename(path + '.tmp', path)
+    return path
+
+
+def run(args):
+    # runs in the child process, prints one JSON line of measurements
+    path = catalog_path(args.workdir, args.run, args.column_stats)
+    fakeora.configure(path, OWNER, args.latency / 1000.0)
+    oracle.ora = fakeora
+    profiler = oracle.OracleProfiler(
+        'BENCH', 'localhost', 1521, 'BENCH', 'bench', 'bench',
+        {'schema': [OWNER]}, bulk=args.bulk, sessions=args.sessions,
+        column_stats=args.column_stats,
+        split_boundaries=args.column_stats)
+    fakeora.reset_stats()
+    start = time.time()
+    profiler.update()
+    elapsed = time.time() - start
+    if profiler.result.get('error'):
+        raise Exception(profiler.result['error'])
+    measured = dict(fakeora.STATS)
+    measured.update({
+        'tables': len(profiler.result['tables']),
+        'seconds': elapsed,
+        # kilobytes on linux
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    })
+    print json.dumps(measured)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=(
+        'Benchmark the Oracle profiler against synthetic catalogs'))
+    parser.add_argument('-n', '--tables', type=int, nargs='+',
+                        default=[100, 1000, 20000],
+                        help='Catalog sizes to benchmark')
+    parser.add_argument('-l', '--latency', type=float, default=0,
+                        help='Milliseconds added to every round trip')
+    parser.add_argument('--bulk', action='store_true', default=False,
+                        help='Profile with bulk catalog loading')
+    parser.add_argument('--sessions', type=int, default=1,
+                        help='Number of sessions to profile with')
+    parser.add_argument('--column-stats', action='store_true', default=False,
+                        help=('Also collect column statistics and split '
+                              'boundaries, on catalogs with data tables'))
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for the generated catalogs')
+    parser.add_argument('--run', type=int, default=None,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.workdir is None:
+        args.workdir = os.path.join(tempfile.gettempdir(),
+                                    'profiler-benchmark')
+    if not os.path.exists(args.workdir):
+        os.makedirs(args.workdir)
+
+    if args.run is not None:
+        run(args)
+        return
+
+    print 'latency %.1fms, bulk %s, sessions %d, column stats %s' % (
+        args.latency, args.bulk, args.sessions, args.column_stats)
+    columns = ['tables', 'seconds', 'round_trips', 'executes', 'rows',
+               'connections', 'maxrss_kb']
+    print ''.join(['%-14s' % c for c in columns])
+    for tables in args.tables:
+        argv = [sys.executable, os.path.abspath(__file__),
+                '--run', str(tables), '--latency', str(args.latency),
+                '--sessions', str(args.sessions),
+                '--workdir', args.workdir]
+        if args.bulk:
+            argv.append('--bulk')
+        if args.column_stats:
+            argv.append('--column-stats')
+        output = subprocess.check_output(argv)
+        measured = json.loads(output.strip().split('\n')[-1])
+        row = []
+        for c in columns:
+            if isinstance(measured[c], float):
+                row.append('%-14.2f' % measured[c])
+            else:
+                row.append('%-14s' % measured[c])
+        print ''.join(row)
+
+
+if __name__ == '__main__':
+    main()
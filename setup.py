@@ -14,7 +14,8 @@ setup(name='dataengineer-toolkit',
       entry_points={
           'console_scripts': [
               'oracle_profiler=dataengineer_toolkit.dbprofiler.oracle:main',
-              'generate_job=dataengineer_toolkit.job_generator.generator:main'
+              'generate_job=dataengineer_toolkit.job_generator.generator:main',
+              'profile_store=dataengineer_toolkit.dbprofiler.store:main'
           ]
       },
       install_requires=[
@@ -29,4 +30,8 @@ setup(name='dataengineer-toolkit',
           'cx_Oracle',
           'RestrictedPython'
       ],
+      extras_require={
+          # the driver of dialect = postgresql datasources
+          'postgresql': ['psycopg2']
+      },
       zip_safe=False)
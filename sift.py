@@ -1,19 +1,24 @@
 import csv
 import json
 import sys
-
-data = json.loads(open(sys.argv[1]).read())
+from dataengineer_toolkit.dbprofiler.store import select_tables
 
 result = []
 full_source = []
 
-for ds in csv.DictReader(open(sys.argv[2]), delimiter=','):
-    for source in data:
-        source_name = source['datasource']['name']
-        if ds['source'].upper() == source_name.upper():
-            for tbl in source['tables']:
-                if str(tbl['table']) == ds['table']:
-                    full_source.append((ds,tbl))
+requested = list(csv.DictReader(open(sys.argv[2]), delimiter=','))
+wanted = set([(ds['source'].upper(), ds['table']) for ds in requested])
+
+# only read the tables listed in the csv, from the profiler output or a
+# profile store
+tables = {}
+for source, tbl in select_tables(sys.argv[1], tables=wanted):
+    key = (source['datasource']['name'].upper(), str(tbl['table']))
+    tables.setdefault(key, []).append(tbl)
+
+for ds in requested:
+    for tbl in tables.get((ds['source'].upper(), ds['table']), []):
+        full_source.append((ds,tbl))
 
 for row in full_source:
     ds,tbl = row
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+#
+# Common ground of the database profilers.
+#
+# A profiler reads the catalog of the schemas of one datasource and
+# produces, per schema, the result the job generator consumes: the
+# datasource, whether OraOop direct mode can be used, profiling metadata
+# and one profile per table with its columns, keys, indexes, size estimate
+# and the derived split_by / merge_key / check_column. Dialects implement
+# _update(), everything derived from the catalog lives here.
+#
+# All schemas are profiled over one connection. The per schema state
+# (schema_attrs) is swapped in by _select_schema(), so that most of the
+# code deals with a single schema in self.ds / self.result.
+
+import json
+import time
+from datetime import datetime
+from dataengineer_toolkit.dbprofiler.trace import Tracer
+
+# with column statistics, split_by candidates with more NULLs or fewer
+# distinct values than this are skipped. Sqoop gives every mapper a range
+# of the split column, so with fewer distinct values than mappers some of
+# them get nothing to import; 25 matches the default max_sessions the
+# job generator planner caps the mapper count with, while the profiler
+# does not know the sessions allowed per source
+SPLIT_MAX_NULL_RATIO = 0.1
+SPLIT_MIN_DISTINCT = 25
+
+
+def now():
+    return datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+
+
+def format_dt(value):
+    if value is None:
+        return None
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_schemas(params):
+    """
+    Schemas of a datasource URI, given as repeated ``schema`` parameters,
+    comma separated or both.
+    """
+    schemas = []
+    for value in params['schema']:
+        for schema in value.split(','):
+            schema = schema.strip()
+            if schema and schema not in schemas:
+                schemas.append(schema)
+    return schemas
+
+
+class BaseProfiler(object):
+
+    dialect = None
+
+    # connection string, formatted with the datasource
+    connstr_template = None
+
+    # column types, as the dialect reports them, usable as split_by /
+    # check_column
+    date_types = []
+    number_types = []
+
+    # attributes kept per schema, see _select_schema()
+    schema_attrs = ['ds', 'result', 'previous', 'resume', '_tables']
+
+    def __init__(self, name, ip, port, database, login, password, params,
+                 exclude_tables=None, tunnel=None, previous=None,
+                 writer=None, trace=None, checkpoint=None, resume=None):
+        # previous and resume hold the previous tables and the checkpoint
+        # state of every schema, keyed by schema
+        self.schemas = get_schemas(params)
+        self.exclude_tables = exclude_tables or []
+
+        self.tunnel = tunnel
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.tracer = None
+        if trace is not None:
+            self.tracer = Tracer(trace, name, self.schemas[0])
+
+        self.results = []
+        self._schemas = {}
+        for schema in self.schemas:
+            ds = {
+                'name': name,
+                'ip': ip,
+                'port': port,
+                'tns': database,
+                'schema': schema,
+                'login': login,
+                'password': password
+            }
+            self.connstr = self.connstr_template % ds
+            result = {
+                'connection_string': self.connstr,
+                'dialect': self.dialect,
+                'datasource': ds,
+                'tables': [],
+                'profiling_metadata': {}
+            }
+            self.results.append(result)
+            self._schemas[schema] = {
+                'ds': ds,
+                'result': result,
+                'previous': (None if previous is None else
+                             previous.get(schema, {})),
+                'resume': (resume or {}).get(schema),
+                '_tables': [],
+                '_timings': {}
+            }
+        self._schema = None
+        self._select_schema(self.schemas[0])
+
+    def _select_schema(self, schema):
+        if schema == self._schema:
+            return
+        if self._schema is not None:
+            state = self._schemas[self._schema]
+            for attr in self.schema_attrs:
+                state[attr] = getattr(self, attr)
+        state = self._schemas[schema]
+        for attr in self.schema_attrs:
+            # dialect attributes start out unset, _update() fills them in
+            setattr(self, attr, state.get(attr))
+        if self.tracer is not None:
+            self.tracer.schema = schema
+            self.tracer.summary = state['_timings']
+        self._schema = schema
+
+    def update(self):
+        pending = []
+        for schema in self.schemas:
+            self._select_schema(schema)
+            if self.resume is not None and self.resume['result'] is not None:
+                self._replay()
+            else:
+                pending.append(schema)
+        if not pending:
+            return
+        self._select_schema(pending[0])
+        if self.tunnel:
+            start = time.time()
+            with self.tunnel as tunnel:
+                if self.tracer is not None:
+                    self.tracer.record('tunnel', 'open', time.time() - start)
+                connds = self.ds.copy()
+                connds['ip'] = self.tunnel.local_bind_host
+                connds['port'] = self.tunnel.local_bind_port
+                self._update(connds, pending)
+        else:
+            self._update(self.ds, pending)
+
+    def _update(self, connds, schemas):
+        raise NotImplementedError
+
+    def _connect_failed(self, schemas):
+        # the error of the last attempt goes to every schema
+        error = self.result.get('error')
+        for schema in schemas:
+            self._select_schema(schema)
+            self.result['error'] = error
+            self._finish()
+            self._open_output()
+            self._close_output()
+
+    def _finish(self):
+        self.result['profiling_metadata']['end_dt'] = now()
+        if self.tracer is not None:
+            self.result['profiling_metadata']['timings'] = (
+                self.tracer.summary)
+
+    def _start_dt(self):
+        # a resumed run keeps the start of the interrupted one
+        if self.resume is not None and self.resume['start_dt']:
+            return self.resume['start_dt']
+        return now()
+
+    def _resumed_tables(self):
+        if self.resume is None:
+            return {}
+        return self.resume['tables']
+
+    def _replay(self):
+        # finished in the interrupted run, nothing to profile
+        self.result.update(self.resume['result'])
+        self._tables = self.resume['table_order']
+        self._open_output()
+        for table_name in self._tables:
+            self._emit(self.resume['tables'][table_name])
+        self._close_output()
+
+    def _open_output(self):
+        # with a writer, tables are streamed out as they are profiled
+        # instead of being collected in self.result['tables']. The
+        # checkpoint gets every table as well.
+        self._profiled = {}
+        self._timed_out = []
+        if self.writer is not None:
+            self._ds_id = self.writer.datasource(self.result)
+        if self.checkpoint is not None:
+            header = dict(self.result)
+            header['table_order'] = self._tables
+            self._checkpoint_id = self.checkpoint.datasource(header)
+
+    def _emit(self, table):
+        if table.get('error'):
+            self._timed_out.append(table['table'])
+        if self.checkpoint is not None:
+            self.checkpoint.table(self._checkpoint_id, table)
+        if self.writer is not None:
+            self.writer.table(self._ds_id, table)
+        else:
+            self._profiled[table['table']] = table
+
+    def _close_output(self):
+        self.result['profiling_metadata']['timed_out_tables'] = len(
+            self._timed_out)
+        if self.writer is None:
+            self.result['tables'] = [self._profiled[t] for t in self._tables]
+        else:
+            self.writer.end(self._ds_id, self.result)
+        if self.checkpoint is not None:
+            self.checkpoint.end(self._checkpoint_id, self.result)
+
+    def _get_check_column(self, indexed_columns, columns):
+        idxed = [i['field'] for i in indexed_columns]
+        types = self.date_types + self.number_types
+        for col in columns:
+            field = col['field'].upper()
+            if field == 'DB_LAST_UPD':
+                continue
+            for kw in ['LAST_UPD', 'MOD_T', 'UPDATED_TIME']:
+                if (kw in field and col['field'] in
+                        idxed and col['type'] in types):
+
+                    return col['field']
+        for col in columns:
+            field = col['field'].upper()
+            for kw in ['CREATED']:
+                if (kw in field and col['field'] in
+                        idxed and col['type'] in types):
+                    return col['field']
+
+        for col in columns:
+            field = col['field'].upper()
+            if field == 'DB_LAST_UPD':
+                continue
+            for kw in ['LAST_UPD', 'MOD_T']:
+                if kw in field:
+                    return col['field']
+
+        for col in columns:
+            field = col['field'].upper()
+            for kw in ['CREATED']:
+                if kw in field:
+                    return col['field']
+
+        return None
+
+    def _get_merge_key(self, columns, pkeys, ukeys, uixs):
+        for col in columns:
+            if ((col['field'] in uixs) or
+                    (col['field'] in ukeys) or
+                    (col['field'] in pkeys)):
+                return col['field']
+        return None
+
+    def _get_split_by(self, columns, indexes, pkeys, ukeys):
+        candidates = self._get_split_candidates(columns, indexes, pkeys, ukeys)
+        return candidates[0] if candidates else None
+
+    def _get_split_candidates(self, columns, indexes, pkeys, ukeys):
+        # split column candidates in order of preference: date then numeric
+        # primary keys, unique keys, indexed numeric columns and finally any
+        # numeric column
+        index_names = [i['field'] for i in indexes]
+        dates = self.date_types
+        numbers = self.number_types
+        tiers = [
+            [c for c in columns if c['field'] in pkeys and
+             c['type'] in dates],
+            [c for c in columns if c['field'] in pkeys and
+             c['type'] in numbers],
+            [c for c in columns if c['field'] in ukeys and
+             c['type'] in dates],
+            [c for c in columns if c['field'] in ukeys and
+             c['type'] in numbers],
+            [c for c in columns if c['field'] in index_names and
+             c['type'] in numbers],
+            [c for c in columns if c['type'] in numbers],
+        ]
+        candidates = []
+        for tier in tiers:
+            for c in tier:
+                if c['field'] not in candidates:
+                    candidates.append(c['field'])
+        return candidates
+
+    def _choose_split_by(self, candidates, column_stats):
+        # among the candidates that are mostly populated and have enough
+        # distinct values to feed every mapper, take the one with the most
+        # distinct values. Ties keep the order of preference above.
+        best = None
+        for col in candidates:
+            stats = column_stats.get(col)
+            if not stats or stats['num_distinct'] is None:
+                continue
+            if (stats['null_ratio'] is not None and
+                    stats['null_ratio'] > SPLIT_MAX_NULL_RATIO):
+                continue
+            if stats['num_distinct'] < SPLIT_MIN_DISTINCT:
+                continue
+            if best is None or stats['num_distinct'] > best[1]:
+                best = (col, stats['num_distinct'])
+        return best[0] if best else None
+
+    def test_connection(self):
+        print '(%s) ANALYZING %s %s' % (now(), self.ds['name'], self.connstr)
+        self.update()
+
+    def save(self):
+        res = self.result
+        fname = 'profiler-%s-%s.json' % (
+            res['datasource']['name'].replace(' ', '_'),
+            res['profiling_metadata']['start_dt'])
+        with open(fname, 'w') as f:
+            f.write(json.dumps(res, indent=4))
+        return fname
+
+    def json(self):
+        return json.dumps(self.result, indent=4)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# Profiling checkpoints.
+#
+# While profiling, every datasource header, table profile and datasource
+# end is appended to a checkpoint file in the JSON lines format of
+# output.JSONLinesWriter. The header also records the order of the tables.
+# A resumed run reads the checkpoint back: datasources that finished are
+# replayed from it, the others are profiled again with the start_dt of the
+# interrupted run, skipping the tables already done. Tables that ended with
+# an error, e.g. a statement timeout, are not done: they are profiled again
+# and keep their datasource from being replayed.
+
+import json
+
+
+def load_checkpoint(fname):
+    """
+    Read a checkpoint into a dict keyed by ``(datasource name, schema)``.
+    Every entry holds the ``start_dt`` of the first attempt and the
+    ``tables`` profiled without error so far. Datasources that ended
+    without error and without table errors also have their ``result``
+    header and ``table_order``, ``result`` is None for the others.
+    """
+    headers = {}
+    state = {}
+    for line in open(fname):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # the last line may have been cut short
+            continue
+        kind = record.pop('record')
+        if kind == 'datasource':
+            ds_id = record.pop('id')
+            key = (record['datasource']['name'],
+                   record['datasource']['schema'])
+            headers[ds_id] = (key, record)
+            entry = state.setdefault(key, {
+                'start_dt': record['profiling_metadata'].get('start_dt'),
+                'tables': {},
+                'errors': set()
+            })
+            entry['result'] = None
+        elif kind == 'table':
+            key = headers[record['datasource_id']][0]
+            table = record['table']
+            if table.get('error'):
+                state[key]['tables'].pop(table['table'], None)
+                state[key]['errors'].add(table['table'])
+            else:
+                state[key]['tables'][table['table']] = table
+                state[key]['errors'].discard(table['table'])
+        elif kind == 'datasource_end':
+            key, header = headers[record['datasource_id']]
+            if record.get('error') or state[key]['errors']:
+                continue
+            result = dict(header)
+            result['profiling_metadata'] = record['profiling_metadata']
+            state[key]['table_order'] = result.pop('table_order')
+            state[key]['result'] = result
+    return state
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+#
+# SQLite backed stand-in for the parts of cx_Oracle the profiler uses, for
+# benchmarking without an Oracle database.
+#
+# build_catalog() writes a synthetic data dictionary (all_tables,
+# all_tab_columns, all_constraints, ...) for one schema into a SQLite file,
+# optionally with small data tables for the sampling queries. After
+# configure(), connect() and SessionPool hand out connections on that file.
+# Every round trip (an execute, or fetching another arraysize batch of rows)
+# sleeps for the configured latency and is counted in STATS.
+
+import re
+import time
+import random
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+CATALOG_SCHEMA = '''
+create table all_tables (owner, table_name, num_rows, avg_row_len,
+    last_analyzed timestamp);
+create table all_tab_columns (owner, table_name, column_name, data_type,
+    column_id, data_precision, data_scale, char_length, nullable);
+create table all_col_comments (owner, table_name, column_name, comments);
+create table all_indexes (owner, index_name, table_owner, table_name,
+    uniqueness);
+create table all_ind_columns (index_owner, index_name, table_owner,
+    table_name, column_name, column_position);
+create table all_constraints (owner, constraint_name, constraint_type,
+    table_name, status);
+create table all_cons_columns (owner, constraint_name, table_name,
+    column_name, position);
+create table all_objects (owner, object_name, object_type,
+    last_ddl_time timestamp);
+create table all_tab_col_statistics (owner, table_name, column_name,
+    num_distinct, num_nulls, low_value, high_value);
+create table all_tab_histograms (owner, table_name, column_name,
+    endpoint_number, endpoint_value);
+create table all_part_tables (owner, table_name, partitioning_type,
+    subpartitioning_type);
+create table all_part_key_columns (owner, name, object_type, column_name,
+    column_position);
+create table all_tab_partitions (table_owner, table_name, partition_name,
+    partition_position, high_value, num_rows, avg_row_len,
+    last_analyzed timestamp);
+create table dba_segments (owner, segment_name, segment_type, bytes);
+create table all_lobs (owner, table_name, column_name, segment_name,
+    index_name);
+create table "V$INSTANCE" (rownum, instance_name);
+insert into "V$INSTANCE" values (1, 'FAKE');
+create index all_tab_columns_ix on all_tab_columns (owner, table_name);
+create index all_col_comments_ix on all_col_comments (owner, table_name);
+create index all_tables_ix on all_tables (table_name);
+create index all_indexes_ix on all_indexes (table_name);
+create index all_ind_columns_ix on all_ind_columns (index_name);
+create index all_constraints_ix on all_constraints (constraint_name);
+create index all_cons_columns_ix on all_cons_columns (table_name);
+create index all_tab_col_statistics_ix on all_tab_col_statistics
+    (owner, table_name);
+create index all_tab_histograms_ix on all_tab_histograms
+    (owner, table_name, column_name);
+'''
+
+TYPES = ['NUMBER', 'VARCHAR2', 'DATE', 'VARCHAR2', 'NUMBER', 'CHAR',
+         'TIMESTAMP(6)', 'CLOB']
+
+# oracle only clauses the profiler uses, removed before SQLite sees them
+SAMPLE_CLAUSE = re.compile(r'SAMPLE\s+(BLOCK\s+)?\([0-9.]+\)')
+
+STATS = {'connections': 0, 'executes': 0, 'round_trips': 0, 'rows': 0}
+_stats_lock = threading.Lock()
+
+_config = {'path': None, 'owner': None, 'latency': 0.0}
+
+
+class DatabaseError(Exception):
+    pass
+
+
+def build_catalog(path, tables, owner='BENCH', seed=0, data_rows=0):
+    """
+    Write a catalog of ``tables`` tables owned by ``owner`` to ``path``.
+    Every table has a numeric primary key, an indexed DATE column and up to
+    20 further columns, a third of the tables a unique key and statistics
+    on their key column. Tables, indexes and CLOB columns have segments.
+    With ``data_rows``, tables holding that many rows are created in
+    ``path + '.' + owner`` for the sampling queries.
+    """
+    rnd = random.Random(seed)
+    db = sqlite3.connect(path)
+    db.executescript(CATALOG_SCHEMA)
+    analyzed = datetime(2020, 1, 1)
+    tab_rows, col_rows, comment_rows, obj_rows = [], [], [], []
+    idx_rows, idxcol_rows, cons_rows, conscol_rows = [], [], [], []
+    stat_rows, seg_rows, lob_rows = [], [], []
+    for t in range(tables):
+        name = 'T%06d' % t
+        tab_rows.append((owner, name, rnd.randint(0, 10 ** 8),
+                         rnd.randint(20, 800), analyzed))
+        obj_rows.append((owner, name, 'TABLE',
+                         analyzed - timedelta(days=rnd.randint(0, 1000))))
+        columns = ['ID', 'LAST_UPDATE'] + [
+            'C%02d' % c for c in range(rnd.randint(0, 20))]
+        for pos, col in enumerate(columns):
+            if pos == 0:
+                data_type = 'NUMBER'
+            elif pos == 1:
+                data_type = 'DATE'
+            else:
+                data_type = rnd.choice(TYPES)
+            # NUMBER precision and scale vary with the position, so that
+            # the random stream and with it the catalog stay the same
+            precision = scale = None
+            if data_type == 'NUMBER' and (t + pos) % 4:
+                precision = [None, 9, 18, 38][(t + pos) % 4]
+                scale = 2 if pos % 5 == 4 else 0
+            col_rows.append((owner, name, col, data_type, pos + 1,
+                             precision, scale,
+                             30 if data_type in ('VARCHAR2', 'CHAR') else 0,
+                             'N' if pos == 0 else 'Y'))
+            comment_rows.append((owner, name, col, 'column %s' % col))
+            if data_type == 'CLOB':
+                lob = 'SYS_LOB%06d%02dC' % (t, pos)
+                lob_rows.append((owner, name, col, lob, lob + '_IX'))
+                seg_rows.append((owner, lob, 'LOBSEGMENT',
+                                 (t * 31 + pos) % 10 ** 4 * 65536))
+                seg_rows.append((owner, lob + '_IX', 'LOBINDEX', 65536))
+        # extents of 64k, with some free space
+        seg_rows.append((owner, name, 'TABLE', (
+            tab_rows[-1][2] * tab_rows[-1][3] * 5 // 4 // 65536 + 1) * 65536))
+        seg_rows.append((owner, name + '_PK', 'INDEX',
+                         (tab_rows[-1][2] // 4096 + 1) * 65536))
+        seg_rows.append((owner, name + '_IX1', 'INDEX',
+                         (tab_rows[-1][2] // 4096 + 1) * 65536))
+        cons_rows.append((owner, name + '_PK', 'P', name, 'ENABLED'))
+        conscol_rows.append((owner, name + '_PK', name, 'ID', 1))
+        idx_rows.append((owner, name + '_PK', owner, name, 'UNIQUE'))
+        idxcol_rows.append((owner, name + '_PK', owner, name, 'ID', 1))
+        idx_rows.append((owner, name + '_IX1', owner, name, 'NONUNIQUE'))
+        idxcol_rows.append((owner, name + '_IX1', owner, name,
+                            'LAST_UPDATE', 1))
+        if t % 3 == 0 and len(columns) > 2:
+            cons_rows.append((owner, name + '_UK', 'U', name, 'ENABLED'))
+            conscol_rows.append((owner, name + '_UK', name, columns[2], 1))
+            # NUMBER 1 and 100000 in oracle's internal format
+            stat_rows.append((owner, name, 'ID', tab_rows[-1][2], 0,
+                              buffer('\xc1\x02'), buffer('\xc3\x0b')))
+    db.executemany('insert into all_tables values (?,?,?,?,?)', tab_rows)
+    db.executemany('insert into all_tab_columns values (?,?,?,?,?,?,?,?,?)',
+                   col_rows)
+    db.executemany('insert into all_col_comments values (?,?,?,?)',
+                   comment_rows)
+    db.executemany('insert into all_indexes values (?,?,?,?,?)', idx_rows)
+    db.executemany('insert into all_ind_columns values (?,?,?,?,?,?)',
+                   idxcol_rows)
+    db.executemany('insert into all_constraints values (?,?,?,?,?)',
+                   cons_rows)
+    db.executemany('insert into all_cons_columns values (?,?,?,?,?)',
+                   conscol_rows)
+    db.executemany('insert into all_objects values (?,?,?,?)', obj_rows)
+    db.executemany(
+        'insert into all_tab_col_statistics values (?,?,?,?,?,?,?)',
+        stat_rows)
+    db.executemany('insert into dba_segments values (?,?,?,?)', seg_rows)
+    db.executemany('insert into all_lobs values (?,?,?,?,?)', lob_rows)
+    db.commit()
+
+    if data_rows:
+        data = sqlite3.connect('%s.%s' % (path, owner))
+        columns = {}
+        for table_name, column_name in db.execute(
+                'select table_name, column_name '
+                'from all_tab_columns order by table_name, column_id'):
+            columns.setdefault(table_name, []).append(column_name)
+        for table_name, cols in sorted(columns.items()):
+            data.execute('create table "%s" (%s)' % (
+                table_name, ', '.join(['"%s"' % c for c in cols])))
+            data.executemany(
+                'insert into "%s" values (%s)' % (
+                    table_name, ', '.join(['?'] * len(cols))),
+                [[i, analyzed + timedelta(days=i)] +
+                 [rnd.randint(0, i) for c in cols[2:]]
+                 for i in range(data_rows)])
+        data.commit()
+        data.close()
+    db.close()
+
+
+def configure(path, owner='BENCH', latency=0.0):
+    """
+    Serve the catalog at ``path``, sleeping ``latency`` seconds per round
+    trip.
+    """
+    _config['path'] = path
+    _config['owner'] = owner
+    _config['latency'] = latency
+
+
+def reset_stats():
+    with _stats_lock:
+        for k in STATS:
+            STATS[k] = 0
+
+
+def _count(**counts):
+    with _stats_lock:
+        for k, v in counts.items():
+            STATS[k] += v
+
+
+class Cursor(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.arraysize = 100
+        self._cursor = connection._db.cursor()
+
+    def _round_trip(self):
+        _count(round_trips=1)
+        timeout = self.connection.callTimeout
+        if _config['latency']:
+            if timeout and _config['latency'] * 1000 > timeout:
+                time.sleep(timeout / 1000.0)
+                raise DatabaseError('DPI-1067: call timeout of %d ms '
+                                    'exceeded with ORA-3156' % timeout)
+            time.sleep(_config['latency'])
+
+    def execute(self, sql, params=None, **kwargs):
+        self._round_trip()
+        _count(executes=1)
+        try:
+            self._cursor.execute(SAMPLE_CLAUSE.sub('', sql),
+                                 params or kwargs or {})
+        except sqlite3.Error, e:
+            raise DatabaseError(str(e))
+        self._first = True
+        return self
+
+    def _fetch_batch(self):
+        # the first batch comes back with the execute
+        if not self._first:
+            self._round_trip()
+        self._first = False
+        rows = self._cursor.fetchmany(self.arraysize)
+        _count(rows=len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self._fetch_batch()
+            for row in rows:
+                yield row
+            if len(rows) < self.arraysize:
+                return
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            _count(rows=1)
+        return row
+
+    def fetchall(self):
+        return list(self)
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection(object):
+
+    def __init__(self):
+        if _config['path'] is None:
+            raise DatabaseError('fakeora.configure() was not called')
+        _count(connections=1)
+        self.stmtcachesize = 20
+        self.callTimeout = 0
+        self._db = sqlite3.connect(
+            _config['path'], check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES)
+        self._db.execute('attach database ? as "%s"' % _config['owner'],
+                         ('%s.%s' % (_config['path'], _config['owner']),))
+
+    def cursor(self):
+        return Cursor(self)
+
+    def ping(self):
+        self._db.execute('select 1')
+
+    def close(self):
+        self._db.close()
+
+
+def connect(*args, **kwargs):
+    return Connection()
+
+
+class SessionPool(object):
+
+    def __init__(self, user=None, password=None, dsn=None, min=1, max=1,
+                 increment=1, threaded=False, **kwargs):
+        self._sessions = threading.BoundedSemaphore(max)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def acquire(self):
+        self._sessions.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return Connection()
+
+    def release(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+        self._sessions.release()
+
+    def drop(self, connection):
+        connection.close()
+        self._sessions.release()
+
+    def close(self):
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
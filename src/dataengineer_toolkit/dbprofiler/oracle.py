@@ -7,8 +7,12 @@
 
 import sys
 import csv
+import time
+import threading
+import Queue
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
+from decimal import Decimal
 from pprint import pprint
 import getpass
 import os
@@ -17,98 +21,768 @@ import cx_Oracle as ora
 import argparse
 from ConfigParser import ConfigParser
 import urlparse
-from sshtunnel import SSHTunnelForwarder
+from dataengineer_toolkit.dbprofiler.output import JSONLinesWriter
+from dataengineer_toolkit.dbprofiler.store import (ProfileStore,
+                                                   select_tables)
+from dataengineer_toolkit.dbprofiler.tunnel import TunnelManager
+from dataengineer_toolkit.dbprofiler.trace import TraceLog
+from dataengineer_toolkit.dbprofiler.base import (BaseProfiler, now,
+                                                  format_dt, get_schemas)
+from dataengineer_toolkit.dbprofiler.postgresql import PostgreSQLProfiler
+from dataengineer_toolkit.dbprofiler.checkpoint import load_checkpoint
 
 
-def now():
-    return datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+# every catalog query uses bind variables, so a statement cache large
+# enough for all of them lets each session parse them only once
+STATEMENT_CACHE_SIZE = 32
 
+# rows fetched per round trip, mostly relevant to the bulk catalog queries
+ARRAYSIZE = 1000
 
-class OracleProfiler(object):
+# column types stored in LOB segments, out of line once they grow past
+# about 4000 bytes and then not part of avg_row_len
+LOB_TYPES = ['CLOB', 'NCLOB', 'BLOB']
 
-    def __init__(self, name, ip, port, database, login, password, params,
-                 exclude_tables=None, tunnel=None):
-        self.ds = {
-            'name': name,
-            'ip': ip,
-            'port': port,
-            'tns': database,
-            'schema': params['schema'][0],
-            'login': login,
-            'password': password
-        }
 
-        self.exclude_tables = exclude_tables or []
+def julian_to_dt(value):
+    # Oracle stores DATE histogram endpoints as julian day numbers with the
+    # time of day as fraction
+    day = int(value)
+    return (datetime.fromordinal(day - 1721425) +
+            timedelta(days=float(value) - day))
 
-        self.connstr = '%(login)s/%(password)s@//%(ip)s:%(port)s/%(tns)s' % (
-            self.ds)
 
-        self.tunnel = tunnel
-        self._tables = []
-        self.result = {
-            'connection_string': self.connstr,
-            'datasource': self.ds,
-            'tables': [],
-            'profiling_metadata': {}
-        }
+def histogram_quantiles(points, buckets):
+    """
+    Interpolate ``buckets + 1`` evenly spaced quantiles from histogram
+    endpoints given as ``(endpoint_number, endpoint_value)``, which for
+    frequency, height balanced and hybrid histograms alike are cumulative.
+    """
+    integral = all([float(v) == int(v) for n, v in points])
+    if points[0][0] != 0:
+        points = [(0, points[0][1])] + points
+    total = float(points[-1][0])
+    values = []
+    j = 1
+    for i in range(buckets + 1):
+        target = total * i / buckets
+        while j < len(points) - 1 and points[j][0] < target:
+            j += 1
+        (n0, v0), (n1, v1) = points[j - 1], points[j]
+        if n1 == n0:
+            value = v1
+        else:
+            value = v0 + (v1 - v0) * (target - n0) / float(n1 - n0)
+        values.append(int(round(value)) if integral else value)
+    return values
+
 
-    def update(self):
-        if self.tunnel:
-            with self.tunnel as tunnel:
-                connds = self.ds
-                connds = self.ds.copy()
-                connds['ip'] = self.tunnel.local_bind_host
-                connds['port'] = self.tunnel.local_bind_port
-
-                connstr = '%(login)s/%(password)s@//%(ip)s:%(port)s/%(tns)s' % (
-                            connds)
-                self._update(connstr)
+def decode_raw_value(data_type, raw):
+    """
+    Decode the internal representation Oracle uses for low_value and
+    high_value in *_tab_col_statistics. Only NUMBER and DATE are
+    understood, anything else gives None.
+    """
+    if raw is None:
+        return None
+    data = bytearray(raw)
+    if data_type == 'DATE' and len(data) == 7:
+        return '%04d-%02d-%02d %02d:%02d:%02d' % (
+            (data[0] - 100) * 100 + data[1] - 100, data[2], data[3],
+            data[4] - 1, data[5] - 1, data[6] - 1)
+    if data_type == 'NUMBER' and data:
+        if data[0] == 0x80:
+            return 0
+        # base 100 digits, the first byte holds sign and exponent. Negative
+        # numbers store complemented digits and a trailing 102.
+        if data[0] & 0x80:
+            sign, exponent = 1, data[0] - 193
+            digits = [d - 1 for d in data[1:]]
         else:
-            connstr = '%(login)s/%(password)s@//%(ip)s:%(port)s/%(tns)s' % (
-                       self.ds)
-            self._update(connstr)
+            sign, exponent = -1, 62 - data[0]
+            digits = [101 - d for d in data[1:] if d != 102]
+        value = Decimal(0)
+        for pos, digit in enumerate(digits):
+            value += Decimal(digit).scaleb(2 * (exponent - pos))
+        value = sign * value
+        if value == value.to_integral_value():
+            return int(value)
+        return float(value)
+    return None
+
+
+class TableTimeout(Exception):
+    pass
+
+
+def is_call_timeout(error):
+    # DPI-1067 is raised when a round trip takes longer than callTimeout
+    return isinstance(error, TableTimeout) or 'DPI-1067' in str(error)
+
 
-    def _update(self, connstr):
+class DeadlineCursor(object):
+    """
+    Cursor wrapper setting the callTimeout of the connection before every
+    ``execute``: ``call_timeout`` seconds, or what is left until
+    ``deadline`` when that comes sooner. Once the deadline has passed,
+    ``execute`` raises TableTimeout.
+    """
 
-        self.result['profiling_metadata']['start_dt'] = now()
+    def __init__(self, cursor, call_timeout):
+        self._cursor = cursor
+        self.call_timeout = call_timeout
+        self.deadline = None
 
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name in ('arraysize', 'prefetchrows'):
+            setattr(self._cursor, name, value)
+        else:
+            object.__setattr__(self, name, value)
+
+    def execute(self, sql, *args, **kwargs):
+        timeout = self.call_timeout
+        if self.deadline is not None:
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+                raise TableTimeout('time budget of the table exceeded')
+            if not timeout or remaining < timeout:
+                timeout = remaining
+        # in milliseconds, 0 turns the timeout off
+        self._cursor.connection.callTimeout = (
+            max(1, int(timeout * 1000)) if timeout else 0)
+        return self._cursor.execute(sql, *args, **kwargs)
+
+
+class OracleProfiler(BaseProfiler):
+
+    dialect = 'oracle'
+    connstr_template = '%(login)s/%(password)s@//%(ip)s:%(port)s/%(tns)s'
+    date_types = ['DATE']
+    number_types = ['NUMBER']
+    schema_attrs = BaseProfiler.schema_attrs + [
+        '_ddl_times', '_partitioned', '_segments', '_catalog']
+
+    def __init__(self, name, ip, port, database, login, password, params,
+                 exclude_tables=None, tunnel=None, bulk=False, sessions=1,
+                 previous=None, writer=None, column_stats=False,
+                 column_stats_sample=1, split_boundaries=False,
+                 split_buckets=32, size_sample=1, call_timeout=0,
+                 table_timeout=0, trace=None, checkpoint=None, resume=None):
+        super(OracleProfiler, self).__init__(
+            name, ip, port, database, login, password, params,
+            exclude_tables=exclude_tables, tunnel=tunnel, previous=previous,
+            writer=writer, trace=trace, checkpoint=checkpoint,
+            resume=resume)
+        self.bulk = bulk
+        self.sessions = sessions
+        self.column_stats = column_stats
+        self.column_stats_sample = column_stats_sample
+        self.split_boundaries = split_boundaries
+        self.split_buckets = split_buckets
+        self.size_sample = size_sample
+        # seconds, 0 for none: every database call, and all the calls
+        # profiling one table
+        self.call_timeout = call_timeout
+        self.table_timeout = table_timeout
+        self._ddl_times = {}
+        self._partitioned = {}
+        self._segments = {}
+        self._catalog = None
+
+    def _connect(self, connds):
         for t in range(3):
+            start = time.time()
             try:
-                con = ora.connect(connstr)
+                if self.sessions > 1:
+                    pool = ora.SessionPool(
+                        user=connds['login'],
+                        password=connds['password'],
+                        dsn='%(ip)s:%(port)s/%(tns)s' % connds,
+                        min=self.sessions, max=self.sessions, increment=1,
+                        threaded=True)
+                    return pool, pool.acquire()
+                return None, ora.connect(
+                    '%(login)s/%(password)s@//%(ip)s:%(port)s/%(tns)s' % (
+                        connds), threaded=True)
             except Exception, e:
                 traceback.print_exc()
                 self.result['error'] = str(e)
-                self.result['profiling_metadata']['end_dt'] = now()
                 if t != 2:
                     print "Retrying..."
-                    continue
-                return
+            finally:
+                if self.tracer is not None:
+                    self.tracer.record('connect', 'attempt %d' % (t + 1),
+                                       time.time() - start)
+        return None, None
+
+    def _cursor(self, con):
+        con.stmtcachesize = STATEMENT_CACHE_SIZE
         cur = con.cursor()
-        self._tables = self._get_tables(cur)
-        for t in self._tables:
-            self.result['tables'].append(self._profile_table(cur, t))
+        cur.arraysize = ARRAYSIZE
+        if hasattr(cur, 'prefetchrows'):
+            # cx_Oracle 8+, fetch the first batch with the execute call
+            cur.prefetchrows = ARRAYSIZE + 1
+        if self.call_timeout or self.table_timeout:
+            cur = DeadlineCursor(cur, self.call_timeout)
+        if self.tracer is not None:
+            return self.tracer.cursor(cur)
+        return cur
+
+    def _alive(self, con):
+        try:
+            con.ping()
+            return True
+        except ora.DatabaseError:
+            return False
+
+    def _reconnect(self, connds, pool, con):
+        # a call that timed out may leave its session unusable, it is
+        # replaced by a new one
+        if pool is not None:
+            pool.drop(con)
+            return pool.acquire()
+        pool, con = self._connect(connds)
+        if con is None:
+            raise Exception(self.result['error'])
+        return con
+
+    def _update(self, connds, schemas):
+
+        for schema in schemas:
+            self._select_schema(schema)
+            self.result['profiling_metadata']['start_dt'] = self._start_dt()
+        self._select_schema(schemas[0])
+
+        pool, con = self._connect(connds)
+        if con is None:
+            self._connect_failed(schemas)
+            return
+
+        # the dictionary is read for all schemas at once
+        cur = self._cursor(con)
+        direct = self._get_directpermission(cur)
+        tables = self._get_tables(cur, schemas)
+        ddl_times = self._get_ddl_times(cur, schemas)
+        partitioned = self._get_partitioned_tables(cur, schemas)
+        segments = self._get_segment_sizes(cur, schemas)
+
+        plans = {}
+        for schema in schemas:
+            self._select_schema(schema)
+            self.result.pop('error', None)
+            self.result['direct'] = direct
+            self._tables = tables.get(schema, [])
+            self._ddl_times = ddl_times.get(schema, {})
+            self._partitioned = partitioned.get(schema, {})
+            self._segments = segments.get(schema, {})
+            self.result['profiling_metadata']['table_count'] = len(
+                self._tables)
+
+            reused = {}
+            if self.previous is not None:
+                reused = self._get_unchanged_tables()
+            refresh = [t for t in self._tables if t not in reused]
+            # tables done before a resumed run was interrupted
+            resumed = self._resumed_tables()
+            pending = [t for t in refresh
+                       if t not in reused and t not in resumed]
+            plans[schema] = (reused, refresh, resumed, pending)
+
+        catalogs = {}
+        if self.bulk:
+            try:
+                catalogs = self._load_catalog(
+                    cur, [s for s in schemas if plans[s][3]], partitioned)
+            except Exception, e:
+                if not is_call_timeout(e):
+                    raise
+                print 'TIMEOUT loading the catalog, profiling table by ' \
+                    'table: %s' % e
+                if not self._alive(con):
+                    con = self._reconnect(connds, pool, con)
+                    cur = self._cursor(con)
+        if pool is not None:
+            pool.release(con)
+
+        for schema in schemas:
+            self._select_schema(schema)
+            reused, refresh, resumed, pending = plans[schema]
+            self._catalog = catalogs.get(schema)
+            self._open_output()
+            for t in self._tables:
+                if t in reused:
+                    self._emit(reused[t])
+            for t in refresh:
+                if t in resumed:
+                    self._emit(resumed[t])
+            if pool is not None:
+                self._profile_tables_parallel(pool, pending, self._emit)
+            else:
+                for t in pending:
+                    profile = self._profile_table(cur, t)
+                    self._emit(profile)
+                    if 'error' in profile and not self._alive(con):
+                        con = self._reconnect(connds, None, con)
+                        cur = self._cursor(con)
+
+            if self.previous is not None:
+                self.result['profiling_metadata']['refreshed_tables'] = (
+                    refresh)
+                self.result['profiling_metadata']['reused_tables'] = [
+                    t for t in self._tables if t in reused]
+            self._finish()
+            self._close_output()
+            self._catalog = None
+
+        if pool is not None:
+            pool.close()
+        else:
+            con.close()
+
+    def _profile_tables_parallel(self, pool, tables, emit):
+        # every session works through the shared list of tables and hands
+        # each profile to emit() as soon as it is done
+        errors = []
+        jobs = Queue.Queue()
+        for table_name in tables:
+            jobs.put(table_name)
+
+        def worker():
+            con = pool.acquire()
+            try:
+                cur = self._cursor(con)
+                while not errors:
+                    try:
+                        table_name = jobs.get_nowait()
+                    except Queue.Empty:
+                        return
+                    profile = self._profile_table(cur, table_name)
+                    emit(profile)
+                    if 'error' in profile and not self._alive(con):
+                        pool.drop(con)
+                        con = None
+                        con = pool.acquire()
+                        cur = self._cursor(con)
+            except Exception:
+                errors.append(sys.exc_info())
+            finally:
+                if con is not None:
+                    pool.release(con)
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(self.sessions, len(tables)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
 
-        self.result['profiling_metadata']['end_dt'] = now()
-        self.result['direct'] = self._get_directpermission(cur)
-        con.close()
+    def _owners(self, schemas):
+        # an owner IN (...) list of bind variables for the schemas
+        binds = dict([('owner%d' % i, schema)
+                      for i, schema in enumerate(schemas)])
+        return ', '.join([':owner%d' % i
+                          for i in range(len(schemas))]), binds
 
-    def _get_tables(self, cursor):
+    def _get_ddl_times(self, cursor, schemas):
+        owners, binds = self._owners(schemas)
+        res = cursor.execute('''
+            SELECT obj.owner, obj.object_name, obj.last_ddl_time,
+                   tbl.last_analyzed
+            FROM all_objects obj, all_tables tbl
+            WHERE obj.owner IN (%s)
+            AND obj.object_type = 'TABLE'
+            AND tbl.owner = obj.owner
+            AND tbl.table_name = obj.object_name
+        ''' % owners, binds)
+        ddl_times = {}
+        for r in res:
+            ddl_times.setdefault(r[0], {})[r[1]] = (format_dt(r[2]),
+                                                    format_dt(r[3]))
+        return ddl_times
+
+    def _get_partitioned_tables(self, cursor, schemas):
+        owners, binds = self._owners(schemas)
+        res = cursor.execute('''
+            SELECT owner, table_name, partitioning_type, subpartitioning_type
+            FROM all_part_tables
+            WHERE owner IN (%s)
+        ''' % owners, binds)
+        partitioned = {}
+        for r in res:
+            partitioned.setdefault(r[0], {})[r[1]] = (r[2], r[3])
+        return partitioned
+
+    def _get_segment_sizes(self, cursor, schemas):
+        # bytes allocated to the table, LOB and index segments of every
+        # table. There is no all_segments view: dba_segments needs
+        # SELECT_CATALOG_ROLE, without it user_segments still covers the
+        # schema of the login.
+        owners, binds = self._owners(schemas)
+        try:
+            res = cursor.execute('''
+                SELECT owner, segment_name, segment_type, SUM(bytes)
+                FROM dba_segments
+                WHERE owner IN (%s)
+                GROUP BY owner, segment_name, segment_type
+            ''' % owners, binds)
+            segments = res.fetchall()
+        except ora.DatabaseError, e:
+            if is_call_timeout(e):
+                raise
+            login = self.ds['login'].upper()
+            if login not in schemas:
+                return {}
+            try:
+                res = cursor.execute('''
+                    SELECT segment_name, segment_type, SUM(bytes)
+                    FROM user_segments
+                    GROUP BY segment_name, segment_type
+                ''')
+                segments = [(login,) + tuple(r) for r in res]
+            except ora.DatabaseError:
+                return {}
+        if not segments:
+            return {}
+
+        # LOB segments and their indexes, and index segments, are named
+        # after themselves and are mapped back to their table
+        owners_of = {}
+        res = cursor.execute('''
+            SELECT owner, table_name, segment_name, index_name
+            FROM all_lobs
+            WHERE owner IN (%s)
+        ''' % owners, binds)
+        for r in res:
+            owners_of[('LOB', r[0], r[2])] = (r[0], r[1])
+            owners_of[('LOB', r[0], r[3])] = (r[0], r[1])
+        res = cursor.execute('''
+            SELECT owner, index_name, table_owner, table_name
+            FROM all_indexes
+            WHERE owner IN (%s)
+        ''' % owners, binds)
+        for r in res:
+            owners_of[('INDEX', r[0], r[1])] = (r[2], r[3])
+
+        sizes = {}
+        for owner, segment_name, segment_type, size in segments:
+            # partitioned tables have a segment per (sub)partition,
+            # 'TABLE PARTITION', 'LOB SUBPARTITION', ...
+            kind = segment_type.split()[0]
+            if kind == 'TABLE':
+                table, part = (owner, segment_name), 'table'
+            elif kind in ('LOB', 'LOBSEGMENT', 'LOBINDEX'):
+                table, part = owners_of.get(
+                    ('LOB', owner, segment_name)), 'lob'
+            elif kind == 'INDEX':
+                table, part = owners_of.get(
+                    ('INDEX', owner, segment_name)), 'index'
+            else:
+                continue
+            if table is None:
+                continue
+            total = sizes.setdefault(table[0], {}).setdefault(
+                table[1], {'table': 0, 'lob': 0, 'index': 0})
+            total[part] += int(size)
+        return sizes
+
+    def _get_size(self, cursor, table_name, columns, num_rows, avg_row_len):
+        # estimated_size with where it came from and how far to trust it.
+        # Allocated table and LOB segments come first, then the optimizer
+        # statistics, which miss LOBs stored out of line, and last a block
+        # sample for tables that were never analyzed.
+        segments = self._segments.get(table_name)
+        if segments is not None and segments['table']:
+            return segments['table'] + segments['lob'], 'segments', 'high'
+        if num_rows is not None and avg_row_len is not None:
+            has_lobs = [c for c in columns if c['type'] in LOB_TYPES]
+            return (num_rows * avg_row_len, 'statistics',
+                    'low' if has_lobs else 'medium')
+        if self.size_sample:
+            sampled = self._sample_size(cursor, table_name, columns)
+            if sampled is not None:
+                return sampled, 'sample', 'low'
+        return None, None, None
+
+    def _sample_size(self, cursor, table_name, columns):
+        # rows counted in a SAMPLE BLOCK of size_sample percent, times the
+        # average stored length of their values
+        lengths = []
+        for col in columns:
+            if col['type'] in LOB_TYPES:
+                lengths.append('NVL(DBMS_LOB.GETLENGTH("%s"), 0)' % (
+                    col['field']))
+            elif not col['type'].startswith('LONG'):
+                lengths.append('NVL(VSIZE("%s"), 0)' % col['field'])
+        try:
+            res = cursor.execute(
+                'SELECT COUNT(*), AVG(%s) FROM "%s"."%s" SAMPLE BLOCK (%s)' % (
+                    ' + '.join(lengths) or '0', self.ds['schema'],
+                    table_name, self.size_sample))
+            count, row_len = res.fetchone()
+        except ora.DatabaseError, e:
+            if is_call_timeout(e):
+                raise
+            # external tables and the like can not be sampled
+            traceback.print_exc()
+            return None
+        return int(round(count * 100.0 / self.size_sample *
+                         float(row_len or 0)))
+
+    def _get_partitioning(self, cursor, table_name):
+        if table_name not in self._partitioned:
+            return None
+        partitioning_type, subpartitioning_type = (
+            self._partitioned[table_name])
+        if self._catalog is not None:
+            key_columns = self._catalog['partition_keys'].get(table_name, [])
+            partitions = self._catalog['partitions'].get(table_name, [])
+        else:
+            res = cursor.execute('''
+                SELECT column_name
+                FROM all_part_key_columns
+                WHERE owner = :owner
+                AND name = :table_name
+                AND object_type = 'TABLE'
+                ORDER BY column_position
+            ''', {'owner': self.ds['schema'], 'table_name': table_name})
+            key_columns = [r[0] for r in res]
+            res = cursor.execute('''
+                SELECT partition_name, partition_position, high_value,
+                       num_rows, avg_row_len, last_analyzed
+                FROM all_tab_partitions
+                WHERE table_owner = :owner
+                AND table_name = :table_name
+                ORDER BY partition_position
+            ''', {'owner': self.ds['schema'], 'table_name': table_name})
+            partitions = [self._partition(r) for r in res]
+        return {
+            'type': partitioning_type,
+            'subpartitioning_type': subpartitioning_type,
+            'key_columns': key_columns,
+            'partitions': partitions
+        }
+
+    def _partition(self, row):
+        name, position, high_value, num_rows, avg_row_len, analyzed = row
+        return {
+            'name': name,
+            'position': position,
+            'high_value': high_value,
+            'num_rows': num_rows,
+            'avg_row_len': avg_row_len,
+            'estimated_size': (None if (
+                num_rows is None or avg_row_len is None) else
+                num_rows * avg_row_len),
+            'last_analyzed': format_dt(analyzed)
+        }
+
+    def _get_unchanged_tables(self):
+        # a table can be carried forward from the previous run when
+        # neither its definition nor its optimizer statistics changed, and
+        # its profile was complete
+        unchanged = {}
+        for table_name in self._tables:
+            prev = self.previous.get(table_name)
+            if prev is None or prev.get('error'):
+                continue
+            last_ddl_time, last_analyzed = self._ddl_times.get(
+                table_name, (None, None))
+            if last_ddl_time is None:
+                continue
+            if (prev.get('last_ddl_time') == last_ddl_time and
+                    prev.get('last_analyzed') == last_analyzed):
+                unchanged[table_name] = prev
+        return unchanged
+
+    def _get_tables(self, cursor, schemas):
+        owners, binds = self._owners(schemas)
         res = cursor.execute("""
-        select owner, table_name from all_tables where owner='%s'
-        """ % self.ds['schema'])
-        tables = []
+        select owner, table_name from all_tables where owner in (%s)
+        """ % owners, binds)
+        tables = {}
         for r in res:
-            if '%s.%s' % (self.ds['schema'], r[1]) not in self.exclude_tables:
-                tables.append(r[1])
+            if '%s.%s' % (r[0], r[1]) not in self.exclude_tables:
+                tables.setdefault(r[0], []).append(r[1])
         return tables
 
+    def _load_catalog(self, cursor, schemas, partitioned):
+        # pull the dictionary views once for all the schemas and index them
+        # by schema and table name, so that the per table lookups below do
+        # not need a round trip each
+        catalogs = {}
+        for schema in schemas:
+            catalogs[schema] = {
+                'columns': {},
+                'comments': {},
+                'row_stats': {},
+                'indexes': {},
+                'primary_keys': {},
+                'unique_keys': {},
+                'partition_keys': {},
+                'partitions': {}
+            }
+            if self.column_stats:
+                catalogs[schema]['column_stats'] = {}
+        if not schemas:
+            return catalogs
+        owners, binds = self._owners(schemas)
+
+        res = cursor.execute('''
+           SELECT cols.owner, cols.table_name, cols.column_name,
+                  cols.data_type, cols.column_id, cols.data_precision,
+                  cols.data_scale, cols.char_length, cols.nullable
+           FROM all_tab_columns cols
+           WHERE cols.owner IN (%s)
+        ''' % owners, binds)
+        for r in res:
+            catalogs[r[0]]['columns'].setdefault(r[1], []).append(
+                self._column(r[2:]))
+
+        res = cursor.execute('''
+           SELECT cols.owner, cols.table_name, cols.column_name,
+                  cols.comments
+           FROM all_col_comments cols
+           WHERE cols.owner IN (%s)
+        ''' % owners, binds)
+        for r in res:
+            catalogs[r[0]]['comments'][(r[1], r[2])] = r[3]
+
+        res = cursor.execute('''
+           SELECT owner, table_name, num_rows, avg_row_len
+           FROM all_tables
+           WHERE owner IN (%s)
+        ''' % owners, binds)
+        for r in res:
+            catalogs[r[0]]['row_stats'][r[1]] = (r[2], r[3])
+
+        res = cursor.execute('''
+            SELECT idxs.table_owner, cidxs.table_name, cidxs.column_name,
+                    cidxs.index_name, idxs.uniqueness
+            FROM all_ind_columns cidxs, all_indexes idxs
+            WHERE idxs.index_name = cidxs.index_name
+            AND idxs.owner = cidxs.index_owner
+            AND idxs.table_owner IN (%s)
+            ORDER BY cidxs.table_name, cidxs.index_name,
+                    cidxs.column_position
+        ''' % owners, binds)
+        for r in res:
+            catalogs[r[0]]['indexes'].setdefault(r[1], []).append(
+                {'field': r[2], 'uniqueness': r[4]})
+
+        res = cursor.execute('''
+            SELECT cons.owner, cols.table_name, cols.column_name,
+                   cons.constraint_type
+            FROM all_constraints cons, all_cons_columns cols
+            WHERE cons.owner IN (%s)
+            AND cons.constraint_type IN ('P', 'U')
+            AND cons.constraint_name = cols.constraint_name
+            AND cons.owner = cols.owner
+            ORDER BY cols.table_name, cols.position
+        ''' % owners, binds)
+        for r in res:
+            key = 'primary_keys' if r[3] == 'P' else 'unique_keys'
+            catalogs[r[0]][key].setdefault(r[1], []).append(r[2])
+
+        if any([partitioned.get(schema) for schema in schemas]):
+            res = cursor.execute('''
+                SELECT owner, name, column_name
+                FROM all_part_key_columns
+                WHERE owner IN (%s)
+                AND object_type = 'TABLE'
+                ORDER BY name, column_position
+            ''' % owners, binds)
+            for r in res:
+                catalogs[r[0]]['partition_keys'].setdefault(
+                    r[1], []).append(r[2])
+            res = cursor.execute('''
+                SELECT table_owner, table_name, partition_name,
+                       partition_position, high_value, num_rows,
+                       avg_row_len, last_analyzed
+                FROM all_tab_partitions
+                WHERE table_owner IN (%s)
+                ORDER BY table_name, partition_position
+            ''' % owners, binds)
+            for r in res:
+                catalogs[r[0]]['partitions'].setdefault(r[1], []).append(
+                    self._partition(r[2:]))
+
+        if self.column_stats:
+            res = cursor.execute('''
+                SELECT owner, table_name, column_name, num_distinct,
+                       num_nulls, low_value, high_value
+                FROM all_tab_col_statistics
+                WHERE owner IN (%s)
+            ''' % owners, binds)
+            for r in res:
+                catalogs[r[0]]['column_stats'].setdefault(
+                    r[1], {})[r[2]] = r[3:]
+
+        return catalogs
+
     def _profile_table(self, cursor, table_name):
-        start_date = now()
+        start = time.time()
+        if self.tracer is not None:
+            cursor.start_table(table_name)
+        if self.table_timeout:
+            cursor.deadline = start + self.table_timeout
+        last_ddl_time, last_analyzed = self._ddl_times.get(
+            table_name, (None, None))
+        profile = {
+            'source': self.ds['name'].replace(' ', '_'),
+            'schema': self.ds['schema'],
+            'table': table_name,
+            'columns': [],
+            'primary_keys': [],
+            'unique_keys': [],
+            'indexed_columns': [],
+            'no_key': True,
+            'split_by': None,
+            'num_rows': None,
+            'avg_row_len': None,
+            'estimated_size': None,
+            'size_source': None,
+            'size_confidence': None,
+            'segment_sizes': self._segments.get(table_name),
+            'unique_indexes': [],
+            'merge_key': None,
+            'check_column': None,
+            'partitioning': None,
+            'last_ddl_time': last_ddl_time,
+            'last_analyzed': last_analyzed,
+        }
+        try:
+            self._fill_profile(cursor, table_name, profile)
+        except Exception, e:
+            if not is_call_timeout(e):
+                raise
+            # keep what was found so far and carry on with the next table
+            print 'TIMEOUT %s.%s: %s' % (self.ds['schema'], table_name, e)
+            profile['error'] = 'timeout: %s' % e
+        finally:
+            if self.table_timeout:
+                cursor.deadline = None
+        if self.tracer is not None:
+            profile['timings'] = cursor.end_table(time.time() - start)
+        return profile
+
+    def _fill_profile(self, cursor, table_name, profile):
+        # profile is updated step by step, so that a timeout leaves the
+        # steps done before it in place
         columns = self._get_columns(cursor, table_name)
+        profile['columns'] = columns
         num_rows, avg_row_len = self._get_row_stats(cursor, table_name)
-        estimated_size = (None if (
-            num_rows is None or avg_row_len is None) else
-            num_rows * avg_row_len)
+        profile['num_rows'] = num_rows
+        profile['avg_row_len'] = avg_row_len
+        estimated_size, size_source, size_confidence = self._get_size(
+            cursor, table_name, columns, num_rows, avg_row_len)
+        profile['estimated_size'] = estimated_size
+        profile['size_source'] = size_source
+        profile['size_confidence'] = size_confidence
 
         indexed_columns = self._get_indexes(cursor, table_name)
         unique_indexes = [i['field']
@@ -116,124 +790,205 @@ class OracleProfiler(object):
                           i['uniqueness'] == 'UNIQUE']
         primary_keys = self._get_primary_keys(cursor, table_name)
         unique_keys = self._get_unique_keys(cursor, table_name)
-        non_key_cols = []
         split_by = self._get_split_by(
             columns, indexed_columns, primary_keys, unique_keys)
-        for col in columns:
-            if col in primary_keys:
-                continue
-            if col in unique_keys:
-                continue
-            non_key_cols.append(col)
-        merge_key = self._get_merge_key(
-            columns, primary_keys, unique_keys, unique_indexes)
-        check_column = self._get_check_column(indexed_columns, columns)
-        return {
-            'source': self.ds['name'].replace(' ', '_'),
-            'schema': self.ds['schema'],
-            'table': table_name,
-            'columns': columns,
+        profile.update({
             'primary_keys': primary_keys,
             'unique_keys': unique_keys,
             'indexed_columns': indexed_columns,
             'no_key': False if (primary_keys or unique_keys) else True,
             'split_by': split_by,
-            'num_rows': num_rows,
-            'avg_row_len': avg_row_len,
-            'estimated_size': estimated_size,
             'unique_indexes': unique_indexes,
-            'merge_key': merge_key,
-            'check_column': check_column,
-        }
-
-    def _get_check_column(self, indexed_columns, columns):
-        idxed = [i['field'] for i in indexed_columns]
-        for col in columns:
-            if col['field'] == 'DB_LAST_UPD':
-                continue
-            for kw in ['LAST_UPD', 'MOD_T', 'UPDATED_TIME']:
-                if (kw in col['field'] and col['field'] in
-                        idxed and col['type'] in ['DATE', 'NUMBER']):
-
-                    return col['field']
-        for col in columns:
-            for kw in ['CREATED']:
-                if (kw in col['field'] and col['field'] in 
-                        idxed and col['type'] in ['DATE', 'NUMBER']):
-                    return col['field']
-
-        for col in columns:
-            if col['field'] == 'DB_LAST_UPD':
-                continue
-            for kw in ['LAST_UPD', 'MOD_T']:
-                if kw in col['field']:
-                    return col['field']
-
-        for col in columns:
-            for kw in ['CREATED']:
-                if kw in col['field']:
-                    return col['field']
+            'merge_key': self._get_merge_key(
+                columns, primary_keys, unique_keys, unique_indexes),
+            'check_column': self._get_check_column(indexed_columns,
+                                                   columns),
+        })
 
-        return None
+        if self.column_stats:
+            candidates = self._get_split_candidates(
+                columns, indexed_columns, primary_keys, unique_keys)
+            column_stats = self._get_column_stats(
+                cursor, table_name, columns, candidates, num_rows)
+            split_by = (self._choose_split_by(candidates, column_stats) or
+                        split_by)
+            profile['column_stats'] = column_stats
+            profile['split_by'] = split_by
+        if self.split_boundaries and split_by:
+            split_type = [c['type'] for c in columns
+                          if c['field'] == split_by][0]
+            split_boundaries = self._get_split_boundaries(
+                cursor, table_name, split_by, split_type)
+            if split_boundaries is not None:
+                profile['split_boundaries'] = split_boundaries
+        profile['partitioning'] = self._get_partitioning(cursor, table_name)
 
     def _get_row_stats(self, cursor, table_name):
+        if self._catalog is not None:
+            return self._catalog['row_stats'].get(table_name, (None, None))
         res = cursor.execute("""
-        select num_rows, avg_row_len from all_tables where table_name = '%s'
-        """ % table_name)
+        select num_rows, avg_row_len from all_tables
+        where table_name = :table_name
+        and owner = :owner
+        """, {'table_name': table_name, 'owner': self.ds['schema']})
         for r in res:
             return r
         return None, None
 
-    def _get_merge_key(self, columns, pkeys, ukeys, uixs):
-        for col in columns:
-            if ((col['field'] in uixs) or
-                    (col['field'] in ukeys) or
-                    (col['field'] in pkeys)):
-                return col['field']
-        return None
+    def _get_column_stats(self, cursor, table_name, columns, candidates,
+                          num_rows):
+        types = dict([(c['field'], c['type']) for c in columns])
+        if self._catalog is not None:
+            rows = self._catalog['column_stats'].get(table_name, {})
+        else:
+            res = cursor.execute('''
+                SELECT column_name, num_distinct, num_nulls, low_value,
+                       high_value
+                FROM all_tab_col_statistics
+                WHERE owner = :owner
+                AND table_name = :table_name
+            ''', {'owner': self.ds['schema'], 'table_name': table_name})
+            rows = dict([(r[0], r[1:]) for r in res])
 
-    def _get_split_by(self, columns, indexes, pkeys, ukeys):
-        for c in [i for i in columns if i['field'] in pkeys]:
-            if c['type'] == 'DATE':
-                return c['field']
-        for c in [i for i in columns if i['field'] in pkeys]:
-            if c['type'] == 'NUMBER':
-                return c['field']
-        for c in [i for i in columns if i['field'] in ukeys]:
-            if c['type'] == 'DATE':
-                return c['field']
-        for c in [i for i in columns if i['field'] in ukeys]:
-            if c['type'] == 'NUMBER':
-                return c['field']
-        index_names = [i['field'] for i in indexes]
-        for c in [i for i in columns if i['field'] in index_names]:
-            if c['type'] == 'NUMBER':
-                return c['field']
-        for c in columns:
-            if c['type'] == 'NUMBER':
-                return c['field']
-        return None
+        stats = {}
+        missing = []
+        for col in candidates:
+            row = rows.get(col)
+            if row is None or row[0] is None:
+                missing.append(col)
+                continue
+            num_distinct, num_nulls, low_value, high_value = row
+            stats[col] = {
+                'num_distinct': num_distinct,
+                'null_ratio': (float(num_nulls) / num_rows
+                               if num_rows and num_nulls is not None
+                               else None),
+                'min': decode_raw_value(types[col], low_value),
+                'max': decode_raw_value(types[col], high_value),
+                'source': 'statistics'
+            }
+        if missing:
+            stats.update(self._sample_column_stats(
+                cursor, table_name, missing, num_rows))
+        return stats
+
+    def _sample_column_stats(self, cursor, table_name, columns, num_rows):
+        # a block sample only reads column_stats_sample percent of the
+        # blocks. The distinct values found in it are scaled to the whole
+        # table with the Duj1 estimator (Haas et al.), from how many of
+        # them the sample holds only once, so that they compare with the
+        # num_distinct of the dictionary statistics:
+        #   D = n * d / (n - f1 + f1 * n / N)
+        # n non null values sampled, d distinct, f1 seen once and N non
+        # null values in the table.
+        # Identifiers can not be bound, they come from the data dictionary
+        # and are quoted
+        inner = []
+        select = ['COUNT(*)']
+        for idx, col in enumerate(columns):
+            names = {'c': col, 'n': 'n%d' % idx}
+            inner.append('"%(c)s", COUNT(*) OVER (PARTITION BY "%(c)s") '
+                         '%(n)s' % names)
+            select.append('COUNT("%(c)s"), COUNT(DISTINCT "%(c)s"), '
+                          'SUM(CASE WHEN "%(c)s" IS NOT NULL AND %(n)s = 1 '
+                          'THEN 1 ELSE 0 END), '
+                          'MIN("%(c)s"), MAX("%(c)s")' % names)
+        res = cursor.execute(
+            'SELECT %s FROM (SELECT %s FROM "%s"."%s" SAMPLE BLOCK (%s))' % (
+                ', '.join(select), ', '.join(inner), self.ds['schema'],
+                table_name, self.column_stats_sample))
+        row = list(res.fetchone())
+        total = row.pop(0)
+        if num_rows is None:
+            num_rows = total * 100.0 / self.column_stats_sample
+        stats = {}
+        for idx, col in enumerate(columns):
+            count, distinct, once, low, high = row[idx * 5:idx * 5 + 5]
+            num_distinct = distinct
+            if count:
+                values = max(num_rows * float(count) / total, count)
+                num_distinct = int(round(
+                    count * distinct /
+                    (count - once + once * count / values)))
+            stats[col] = {
+                'num_distinct': num_distinct,
+                'null_ratio': (1 - float(count) / total) if total else None,
+                'min': format_dt(low) if isinstance(low, datetime) else low,
+                'max': format_dt(high) if isinstance(high, datetime) else high,
+                'source': 'sample'
+            }
+        return stats
+
+    def _get_split_boundaries(self, cursor, table_name, column, data_type):
+        # quantiles of the split column, from the optimizer histogram when
+        # there is one, otherwise from an NTILE over a sample
+        res = cursor.execute('''
+            SELECT endpoint_number, endpoint_value
+            FROM all_tab_histograms
+            WHERE owner = :owner
+            AND table_name = :table_name
+            AND column_name = :column_name
+            ORDER BY endpoint_number
+        ''', {'owner': self.ds['schema'], 'table_name': table_name,
+              'column_name': column})
+        points = [(r[0], r[1]) for r in res if r[1] is not None]
+        # a column without a histogram still has its min and max endpoints
+        if len(points) > 2:
+            values = histogram_quantiles(points, self.split_buckets)
+            if data_type == 'DATE':
+                values = [format_dt(julian_to_dt(v)) for v in values]
+            return {'column': column, 'source': 'histogram',
+                    'values': values}
+
+        res = cursor.execute('''
+            SELECT bucket, MIN(v), MAX(v) FROM (
+                SELECT "%(c)s" v, NTILE(:buckets) OVER (ORDER BY "%(c)s") bucket
+                FROM "%(o)s"."%(t)s" SAMPLE BLOCK (%(pct)s)
+                WHERE "%(c)s" IS NOT NULL)
+            GROUP BY bucket
+            ORDER BY bucket
+        ''' % {'c': column, 'o': self.ds['schema'], 't': table_name,
+               'pct': self.column_stats_sample},
+            {'buckets': self.split_buckets})
+        rows = res.fetchall()
+        if not rows:
+            return None
+        values = [rows[0][1]] + [r[2] for r in rows]
+        values = [format_dt(v) if isinstance(v, datetime) else v
+                  for v in values]
+        return {'column': column, 'source': 'sample', 'values': values}
 
     def _get_columns(self, cursor, table_name):
+        if self._catalog is not None:
+            cols = self._catalog['columns'].get(table_name, [])
+            for col in cols:
+                col['comment'] = self._catalog['comments'].get(
+                    (table_name, col['field']))
+            return sorted(cols, key=lambda x: x['id'])
+
         _get_columns_sql = '''
-           SELECT cols.column_name, cols.data_type, cols.column_id
+           SELECT cols.column_name, cols.data_type, cols.column_id,
+                  cols.data_precision, cols.data_scale, cols.char_length,
+                  cols.nullable
            FROM all_tab_columns cols
-           WHERE cols.table_name = '%s'
-           AND cols.owner = '%s'
-        ''' % (table_name, self.ds['schema'])
-        res = cursor.execute(_get_columns_sql)
+           WHERE cols.table_name = :table_name
+           AND cols.owner = :owner
+        '''
+        res = cursor.execute(_get_columns_sql, {
+            'table_name': table_name, 'owner': self.ds['schema']})
         cols = []
         for col in res:
-            cols.append({'field': col[0], 'type': col[1], 'id': col[2]})
+            cols.append(self._column(col))
 
         _get_columns_comment = '''
            SELECT cols.column_name, cols.comments
            FROM all_col_comments cols
-           WHERE cols.table_name = '%s'
-           AND cols.owner = '%s'
-        ''' % (table_name, self.ds['schema'])
+           WHERE cols.table_name = :table_name
+           AND cols.owner = :owner
+        '''
 
-        res = cursor.execute(_get_columns_comment)
+        res = cursor.execute(_get_columns_comment, {
+            'table_name': table_name, 'owner': self.ds['schema']})
         comments = {}
         for cmt in res:
             comments[cmt[0]] = cmt[1]
@@ -243,34 +998,60 @@ class OracleProfiler(object):
 
         return sorted(cols, key=lambda x: x['id'])
 
+    def _column(self, row):
+        name, data_type, column_id, precision, scale, char_length, \
+            nullable = row
+        return {
+            'field': name,
+            'type': data_type,
+            'id': column_id,
+            'precision': precision,
+            'scale': scale,
+            # in characters, 0 for types other than the character ones
+            'char_length': char_length,
+            'nullable': nullable == 'Y'
+        }
+
     def _get_primary_keys(self, cursor, table_name):
+        if self._catalog is not None:
+            return self._catalog['primary_keys'].get(table_name, [])
+
         _get_primary_key_sql = '''
             SELECT cols.table_name, cols.column_name, cols.position, cons.status,
                     cons.owner
             FROM all_constraints cons, all_cons_columns cols
-            WHERE cols.table_name = '%s' 
+            WHERE cols.table_name = :table_name
+            AND cols.owner = :owner
             AND cons.constraint_type = 'P'
             AND cons.constraint_name = cols.constraint_name
             AND cons.owner = cols.owner
             ORDER BY cols.table_name, cols.position
-        ''' % table_name
+        '''
 
-        res = cursor.execute(_get_primary_key_sql)
+        res = cursor.execute(_get_primary_key_sql, {
+            'table_name': table_name, 'owner': self.ds['schema']})
         pk = []
         for col in res:
             pk.append(col[1])
         return pk
 
     def _get_indexes(self, cursor, table_name):
+        if self._catalog is not None:
+            return self._catalog['indexes'].get(table_name, [])
+
         _get_index_sql = '''
             SELECT cidxs.table_name, cidxs.column_name, cidxs.index_name, 
                     idxs.uniqueness
             FROM all_ind_columns cidxs, all_indexes idxs
             WHERE idxs.index_name = cidxs.index_name
-            AND idxs.table_name = '%s'
-        ''' % table_name
+            AND idxs.owner = cidxs.index_owner
+            AND idxs.table_name = :table_name
+            AND idxs.table_owner = :owner
+            ORDER BY cidxs.index_name, cidxs.column_position
+        '''
 
-        res = cursor.execute(_get_index_sql)
+        res = cursor.execute(_get_index_sql, {
+            'table_name': table_name, 'owner': self.ds['schema']})
         idxs = []
         for col in res:
             idxs.append({'field': col[1],
@@ -278,18 +1059,23 @@ class OracleProfiler(object):
         return idxs
 
     def _get_unique_keys(self, cursor, table_name):
+        if self._catalog is not None:
+            return self._catalog['unique_keys'].get(table_name, [])
+
         _get_unique_key_sql = '''
             SELECT cols.table_name, cols.column_name, cols.position, cons.status, 
                     cons.owner
             FROM all_constraints cons, all_cons_columns cols
-            WHERE cols.table_name = '%s' 
+            WHERE cols.table_name = :table_name
+            AND cols.owner = :owner
             AND cons.constraint_type = 'U'
             AND cons.constraint_name = cols.constraint_name
             AND cons.owner = cols.owner
             ORDER BY cols.table_name, cols.position
-        ''' % table_name
+        '''
 
-        res = cursor.execute(_get_unique_key_sql)
+        res = cursor.execute(_get_unique_key_sql, {
+            'table_name': table_name, 'owner': self.ds['schema']})
         uk = []
         for col in res:
             uk.append(col[1])
@@ -306,22 +1092,6 @@ class OracleProfiler(object):
         except:
             return False
 
-    def test_connection(self):
-        print '(%s) ANALYZING %s %s' % (now(), self.ds['name'], self.connstr)
-        self.update()
-
-    def save(self):
-        res = self.result
-        fname = 'profiler-%s-%s.json' % (
-            res['datasource']['name'].replace(' ', '_'),
-            res['profiling_metadata']['start_dt'])
-        with open(fname, 'w') as f:
-            f.write(json.dumps(res, indent=4))
-        return fname
-
-    def json(self):
-        return json.dumps(self.result, indent=4)
-
 
 def get_exclude_tables(cfg, ds):
 
@@ -335,15 +1105,174 @@ def get_exclude_tables(cfg, ds):
         exclude_tables = cfg.get('source:%s' % ds['name'], 'exclude_tables'
                                  ).strip().split()
 
-    return exclude_tables + ['%s.%s' % (
-        ds['params']['schema'][0], i) for i in global_exclude_tables]
+    return exclude_tables + ['%s.%s' % (schema, i)
+                             for schema in get_schemas(ds['params'])
+                             for i in global_exclude_tables]
+
+
+def get_source_option(cfg, ds, option, default=None, getter='get'):
+    for section in ['source:%s' % ds['name'], 'sources_global']:
+        if cfg.has_option(section, option):
+            return getattr(cfg, getter)(section, option)
+    return default
+
+
+# profiler per datasource URI scheme
+PROFILERS = {
+    'oracle': OracleProfiler,
+    'postgresql': PostgreSQLProfiler,
+    'postgres': PostgreSQLProfiler,
+}
+
+
+def failed_results(dialect, ds, error):
+    # results of a datasource whose profiler could not be created, one per
+    # schema as far as they can be told
+    try:
+        schemas = get_schemas(ds['params'])
+    except Exception:
+        schemas = [None]
+    return [{
+        'dialect': dialect,
+        'datasource': {
+            'name': ds.get('name'),
+            'ip': ds.get('ip'),
+            'port': ds.get('port'),
+            'tns': ds.get('database'),
+            'schema': schema,
+            'login': ds.get('login'),
+            'password': ds.get('password')
+        },
+        'tables': [],
+        'profiling_metadata': {},
+        'error': error
+    } for schema in schemas]
+
+
+def profile_datasources(datasources, workers=1, workers_per_host=1):
+    """
+    Profile datasources on a pool of worker threads, running at most
+    ``workers`` profilers at once and at most ``workers_per_host`` against
+    the same database host. Returns the results, one per schema, in the
+    order of ``datasources`` together with the wall clock seconds spent on
+    the datasource of each.
+    """
+    pending = list(enumerate(datasources))
+    results = [None] * len(datasources)
+    timings = [None] * len(datasources)
+    active_hosts = {}
+    cond = threading.Condition()
+
+    def next_job():
+        # pick the first pending datasource whose host is not saturated,
+        # so one busy host does not hold up datasources on other hosts
+        with cond:
+            while pending:
+                for pos, (idx, ds) in enumerate(pending):
+                    if active_hosts.get(ds['ip'], 0) < workers_per_host:
+                        del pending[pos]
+                        active_hosts[ds['ip']] = active_hosts.get(
+                            ds['ip'], 0) + 1
+                        return idx, ds
+                cond.wait()
+            return None
+
+    def release(ds):
+        with cond:
+            active_hosts[ds['ip']] -= 1
+            cond.notify_all()
+
+    def worker():
+        while True:
+            job = next_job()
+            if job is None:
+                return
+            idx, ds = job
+            start = time.time()
+            options = ds.copy()
+            dialect = options.pop('dialect', 'oracle')
+            profiler = None
+            try:
+                profiler = PROFILERS[dialect](**options)
+                profiler.test_connection()
+            except Exception, e:
+                traceback.print_exc()
+                if profiler is None:
+                    results[idx] = failed_results(dialect, ds, str(e))
+                else:
+                    # schemas not profiled yet
+                    for result in profiler.results:
+                        if 'end_dt' not in result['profiling_metadata']:
+                            result['error'] = str(e)
+            finally:
+                release(ds)
+            if profiler is not None:
+                results[idx] = profiler.results
+            timings[idx] = time.time() - start
+
+    threads = [threading.Thread(target=worker)
+               for i in range(max(1, min(workers, len(datasources))))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        # join with a timeout so KeyboardInterrupt still reaches us
+        while t.is_alive():
+            t.join(1)
+    flat_results, flat_timings = [], []
+    for res, elapsed in zip(results, timings):
+        flat_results.extend(res)
+        flat_timings.extend([elapsed] * len(res))
+    return flat_results, flat_timings
+
+
+def print_report(results, timings):
+    print 'PROFILING REPORT'
+    for res, elapsed in zip(results, timings):
+        ds = res['datasource']
+        timed_out = res['profiling_metadata'].get('timed_out_tables', 0)
+        if res.get('error'):
+            status = 'ERROR: %s' % res['error']
+        elif timed_out:
+            status = 'TIMEOUT: %d tables, rerun with --resume' % timed_out
+        else:
+            status = 'OK'
+        print '%-30s %-30s %10.1fs %6s tables %s' % (
+            ds['name'], ds['schema'], elapsed,
+            res['profiling_metadata'].get('table_count', 0), status)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', help='Config File', default=None)
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of datasources to profile concurrently')
+    parser.add_argument('--workers-per-host', type=int, default=None,
+                        help=('Number of datasources on the same database '
+                              'host to profile concurrently'))
+    parser.add_argument('-p', '--previous', default=None,
+                        help=('Previous profiler output or profile store; '
+                              'only tables whose DDL or statistics changed '
+                              'are re-profiled'))
+    parser.add_argument('-f', '--format', choices=['json', 'jsonl'],
+                        default='json',
+                        help=('Output format, jsonl streams one record per '
+                              'table as it is profiled'))
+    parser.add_argument('-t', '--trace', action='store_true', default=False,
+                        help=('Time connections, catalog queries and tables, '
+                              'and report the slowest ones'))
+    parser.add_argument('--trace-file', default=None,
+                        help='Write timing events as JSON lines to this file')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest tables and queries reported')
+    parser.add_argument('-s', '--store', default=None,
+                        help='Also import the output into this profile store')
+    parser.add_argument('--checkpoint', default='profiler-checkpoint.jsonl',
+                        help='File profiling progress is checkpointed to')
+    parser.add_argument('-r', '--resume', action='store_true', default=False,
+                        help=('Resume the run interrupted at the checkpoint, '
+                              'only profiling what it did not finish'))
     args = parser.parse_args()
-    result = []
 
     config = args.config or 'profiler.cfg'
     if not os.path.exists(config):
@@ -352,13 +1281,29 @@ def main():
     cfg = ConfigParser()
     cfg.readfp(open(config))
 
+    previous = {}
+    if args.previous:
+        for res, table in select_tables(args.previous):
+            key = (res['datasource']['name'], res['datasource']['schema'])
+            previous.setdefault(key, {})[table['table']] = table
+
+    resume = {}
+    if args.resume and os.path.exists(args.checkpoint):
+        resume = load_checkpoint(args.checkpoint)
+    checkpoint = JSONLinesWriter(args.checkpoint, append=args.resume)
+
     datasources = []
     for name in [i.split(':')[1] for i in cfg.sections() if 'source:' in i]:
         uris = cfg.get('source:%s' % name, 'dburis').strip().split()
         for uri in uris:
             uridata = urlparse.urlparse(uri)
+            if uridata.scheme not in PROFILERS:
+                raise Exception('Unsupported datasource "%s" in %s' % (
+                    uridata.scheme, name))
             qs = urlparse.parse_qs(uridata.query)
+            schemas = get_schemas(qs)
             ds = {
+                'dialect': uridata.scheme,
                 'name': name.upper(),
                 'ip': uridata.hostname,
                 'port': uridata.port,
@@ -368,6 +1313,30 @@ def main():
                 'params': qs
             }
             exclude_tables = get_exclude_tables(cfg, ds)
+            ds['bulk'] = get_source_option(cfg, ds, 'bulk', False,
+                                           'getboolean')
+            ds['sessions'] = get_source_option(cfg, ds, 'sessions', 1,
+                                               'getint')
+            ds['column_stats'] = get_source_option(
+                cfg, ds, 'column_stats', False, 'getboolean')
+            ds['column_stats_sample'] = get_source_option(
+                cfg, ds, 'column_stats_sample', 1, 'getfloat')
+            ds['split_boundaries'] = get_source_option(
+                cfg, ds, 'split_boundaries', False, 'getboolean')
+            ds['split_buckets'] = get_source_option(
+                cfg, ds, 'split_buckets', 32, 'getint')
+            ds['size_sample'] = get_source_option(
+                cfg, ds, 'size_sample', 1, 'getfloat')
+            ds['call_timeout'] = get_source_option(
+                cfg, ds, 'call_timeout', 0, 'getfloat')
+            ds['table_timeout'] = get_source_option(
+                cfg, ds, 'table_timeout', 0, 'getfloat')
+            if args.previous:
+                ds['previous'] = dict([
+                    (s, previous.get((ds['name'], s), {})) for s in schemas])
+            ds['checkpoint'] = checkpoint
+            ds['resume'] = dict([(s, resume.get((ds['name'], s)))
+                                 for s in schemas])
             datasources.append(ds)
 
     tunnel = {}
@@ -378,21 +1347,57 @@ def main():
             tunnel['user'] = cfg.get('tunnel', 'user')
             tunnel['password'] = cfg.get('tunnel', 'password')
 
+    # one SSH transport to the bastion, shared by all datasources
+    tunnels = TunnelManager()
     for ds in datasources:
         if tunnel:
-            ds['tunnel'] = SSHTunnelForwarder(
-                tunnel['host'],
-                ssh_username=tunnel['user'],
-                ssh_password=tunnel['password'],
-                remote_bind_address=(ds['ip'], ds['port']))
-        profiler = OracleProfiler(**ds)
-        profiler.test_connection()
-        result.append(profiler.result)
-
-    fname = 'profiler-output-%s.json' % now()
-    with open(fname, 'w') as f:
-        f.write(json.dumps(result, indent=4))
+            ds['tunnel'] = tunnels.endpoint(
+                tunnel['host'], tunnel['port'], tunnel['user'],
+                tunnel['password'], (ds['ip'], ds['port']))
+
+    workers = args.workers
+    if workers is None and cfg.has_option('sources_global', 'workers'):
+        workers = cfg.getint('sources_global', 'workers')
+    workers_per_host = args.workers_per_host
+    if (workers_per_host is None and
+            cfg.has_option('sources_global', 'workers_per_host')):
+        workers_per_host = cfg.getint('sources_global', 'workers_per_host')
+
+    writer = None
+    if args.format == 'jsonl':
+        writer = JSONLinesWriter('profiler-output-%s.jsonl' % now())
+        for ds in datasources:
+            ds['writer'] = writer
+
+    trace = None
+    if args.trace or args.trace_file:
+        trace = TraceLog(args.trace_file)
+        for ds in datasources:
+            ds['trace'] = trace
+
+    result, timings = profile_datasources(datasources, workers or 1,
+                                          workers_per_host or 1)
+    print_report(result, timings)
+    if trace is not None:
+        trace.report(args.top)
+        trace.close()
+    tunnels.close()
+    checkpoint.close()
+
+    if writer is not None:
+        writer.close()
+        fname = writer.fname
         print "WRITTEN %s" % fname
+    else:
+        fname = 'profiler-output-%s.json' % now()
+        with open(fname, 'w') as f:
+            f.write(json.dumps(result, indent=4))
+            print "WRITTEN %s" % fname
+
+    if args.store:
+        store = ProfileStore(args.store)
+        print "STORED %s as run %s" % (fname, store.import_file(fname))
+        store.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+#
+# Reading and writing profiler output.
+#
+# Besides the single JSON array written by oracle_profiler, results can be
+# streamed as JSON lines. Every line is one record:
+#
+#   {"record": "datasource", "id": 0, "datasource": {...}, ...}
+#   {"record": "table", "datasource_id": 0, "table": {...}}
+#   {"record": "datasource_end", "datasource_id": 0,
+#    "profiling_metadata": {...}, "error": ...}
+#
+# Datasources profiled concurrently interleave their table records, which
+# is why every table record refers back to its datasource header.
+#
+# Both formats are read one table at a time, so that reading the output of
+# a whole estate takes no more memory than its largest table.
+
+import os
+import re
+import json
+import threading
+
+# bytes read at a time from JSON array files
+READ_BLOCK = 64 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# the next bracket outside of strings, which may hold brackets, or the
+# quote of a string that goes on past the buffer
+BRACKET = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*'
+                     r'([\[\]{}"])')
+
+
+class JSONLinesWriter(object):
+
+    def __init__(self, fname, append=False):
+        self.fname = fname
+        self._lock = threading.Lock()
+        self._next_id = 0
+        if append and os.path.exists(fname):
+            # continue after the datasources already in the file, which may
+            # end in a line cut short by a crash
+            last = ''
+            for line in open(fname):
+                last = line
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('record') == 'datasource':
+                    self._next_id = max(self._next_id, record['id'] + 1)
+            self._fp = open(fname, 'a')
+            if last and not last.endswith('\n'):
+                self._fp.write('\n')
+        else:
+            self._fp = open(fname, 'w')
+
+    def _write(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._fp.write(line)
+            self._fp.flush()
+
+    def datasource(self, result):
+        with self._lock:
+            ds_id = self._next_id
+            self._next_id += 1
+        record = {'record': 'datasource', 'id': ds_id}
+        for k, v in result.items():
+            if k != 'tables':
+                record[k] = v
+        self._write(record)
+        return ds_id
+
+    def table(self, ds_id, table):
+        self._write({'record': 'table', 'datasource_id': ds_id,
+                     'table': table})
+
+    def end(self, ds_id, result):
+        self._write({'record': 'datasource_end', 'datasource_id': ds_id,
+                     'profiling_metadata': result['profiling_metadata'],
+                     'error': result.get('error')})
+
+    def close(self):
+        self._fp.close()
+
+
+def _is_jsonlines(fname):
+    with open(fname) as f:
+        while True:
+            c = f.read(1)
+            if not c or not c.isspace():
+                return c == '{'
+
+
+class _StreamDecoder(object):
+    # raw_decode() over a file read a block at a time, for JSON documents
+    # that are only ever decoded one value at a time
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.seek(0)
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.offset = offset
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def _read(self, size):
+        # drop what has been decoded, keep the rest
+        self.offset += self.pos
+        data = self.f.read(size)
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+
+    def peek(self):
+        # the next non whitespace character, '' at the end of the file
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._read(READ_BLOCK)
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError('Expecting %s at byte %d' % (
+                ' or '.join(repr(x) for x in chars), self.tell()))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        size = READ_BLOCK
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may go on in the file
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # values larger than the buffer double the read, so that large
+            # tables are not decoded over and over
+            self._read(size)
+            size *= 2
+
+    def skip(self):
+        # step over the next value without decoding it, counting brackets
+        # outside of strings. A lone quote is a string the buffer cuts short.
+        if self.peek() not in '[{':
+            self.value()
+            return
+        depth = 0
+        while True:
+            for token in BRACKET.finditer(self.buf, self.pos):
+                c = token.group(1)
+                if c == '"':
+                    self.pos = token.start(1)
+                    break
+                if c == '[' or c == '{':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        self.pos = token.end()
+                        return
+            else:
+                self.pos = len(self.buf)
+            if self.eof:
+                raise ValueError('Unterminated value at byte %d' %
+                                 self.tell())
+            self._read(READ_BLOCK)
+
+    def items(self):
+        # step through an array, the caller reads every item off
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(',]') == ']':
+                return
+
+
+def _iter_array_tables(f):
+    # the keys of a datasource come in any order (json.dumps() of a dict
+    # on Python 2), so the tables are first stepped over without decoding
+    # them to read the rest of the header, then decoded one at a time
+    reader = _StreamDecoder(f)
+    for _ in reader.items():
+        reader.expect('{')
+        ds = {}
+        tables_at = None
+        if reader.peek() == '}':
+            reader.pos += 1
+        else:
+            while True:
+                key = reader.value()
+                reader.expect(':')
+                if key == 'tables':
+                    tables_at = reader.tell()
+                    reader.skip()
+                else:
+                    ds[key] = reader.value()
+                if reader.expect(',}') == '}':
+                    break
+        if tables_at is None:
+            continue
+        end = reader.tell()
+        reader.seek(tables_at)
+        for _ in reader.items():
+            yield ds, reader.value()
+        reader.seek(end)
+
+
+def iter_tables(fname):
+    """
+    Yield ``(datasource, table)`` pairs from a profiler output file, in
+    either the JSON array or the JSON lines format. ``datasource`` is the
+    datasource result without its ``tables`` list.
+    """
+    if not _is_jsonlines(fname):
+        with open(fname, 'rb') as f:
+            for ds, table in _iter_array_tables(f):
+                yield ds, table
+        return
+
+    headers = {}
+    with open(fname) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('record')
+            if kind == 'datasource':
+                headers[record.pop('id')] = record
+            elif kind == 'table':
+                yield headers[record['datasource_id']], record['table']
+            elif kind == 'datasource_end':
+                ds = headers[record['datasource_id']]
+                ds['profiling_metadata'] = record['profiling_metadata']
+                if record.get('error'):
+                    ds['error'] = record['error']
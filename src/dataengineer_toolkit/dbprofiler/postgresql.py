@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+#
+# PostgreSQL profiler.
+#
+# All schemas of the datasource are read from pg_catalog in four set based
+# queries (relations with their size estimates, columns, key constraints
+# and indexes), then every table is profiled from memory into the same shape
+# OracleProfiler produces. Row counts are the planner estimate reltuples,
+# sizes the bytes on disk of the table and its TOAST table, which holds
+# the large values the way LOB segments do on Oracle. A partitioned table
+# is profiled as one table with the row counts and sizes of its leaf
+# partitions summed up, the partitions themselves are left out
+# (pg_partition_tree() needs PostgreSQL 12). Connecting needs psycopg2, the
+# postgresql extra of the package.
+
+import time
+import traceback
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from dataengineer_toolkit.dbprofiler.base import BaseProfiler, format_dt
+
+
+class _Cursor(object):
+    # the execute(sql, binds) interface of a cx_Oracle cursor on top of a
+    # sqlalchemy connection, so that the profiler tracing works unchanged
+
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, params=None):
+        return self.con.execute(text(sql), **(params or {}))
+
+
+class PostgreSQLProfiler(BaseProfiler):
+
+    dialect = 'postgresql'
+    connstr_template = (
+        'postgresql://%(login)s:%(password)s@%(ip)s:%(port)s/%(tns)s')
+    date_types = ['date', 'timestamp without time zone',
+                  'timestamp with time zone']
+    number_types = ['smallint', 'integer', 'bigint', 'numeric']
+
+    def __init__(self, name, ip, port, database, login, password, params,
+                 exclude_tables=None, tunnel=None, previous=None,
+                 writer=None, trace=None, checkpoint=None, resume=None,
+                 call_timeout=0, **options):
+        # bulk, sessions, the column statistics options and table_timeout
+        # are specific to OracleProfiler and ignored here, call_timeout
+        # becomes the statement_timeout of the session. Postgres keeps no
+        # DDL timestamps, so previous results can not be reused either and
+        # every table is profiled.
+        super(PostgreSQLProfiler, self).__init__(
+            name, ip, port or 5432, database, login, password, params,
+            exclude_tables=exclude_tables, tunnel=tunnel, previous=None,
+            writer=writer, trace=trace, checkpoint=checkpoint,
+            resume=resume)
+        self.call_timeout = call_timeout
+
+    def _connect(self, connds):
+        engine = create_engine(self.connstr_template % connds,
+                               poolclass=NullPool)
+        for t in range(3):
+            start = time.time()
+            try:
+                con = engine.connect()
+                if self.call_timeout:
+                    con.execute(text('SET statement_timeout = %d' % (
+                        self.call_timeout * 1000)))
+                return con
+            except Exception, e:
+                traceback.print_exc()
+                self.result['error'] = str(e)
+                if t != 2:
+                    print "Retrying..."
+            finally:
+                if self.tracer is not None:
+                    self.tracer.record('connect', 'attempt %d' % (t + 1),
+                                       time.time() - start)
+        return None
+
+    def _cursor(self, con):
+        cur = _Cursor(con)
+        if self.tracer is not None:
+            return self.tracer.cursor(cur)
+        return cur
+
+    def _update(self, connds, schemas):
+
+        for schema in schemas:
+            self._select_schema(schema)
+            self.result['profiling_metadata']['start_dt'] = self._start_dt()
+        self._select_schema(schemas[0])
+
+        con = self._connect(connds)
+        if con is None:
+            self._connect_failed(schemas)
+            return
+
+        cur = self._cursor(con)
+        catalogs = self._load_catalog(cur, schemas)
+        for schema in schemas:
+            self._select_schema(schema)
+            self.result.pop('error', None)
+            # OraOop direct mode does not apply to postgres
+            self.result['direct'] = False
+            catalog = catalogs[schema]
+            self._tables = [
+                t for t in sorted(catalog['tables'])
+                if '%s.%s' % (schema, t) not in self.exclude_tables]
+            self.result['profiling_metadata']['table_count'] = len(
+                self._tables)
+
+            self._open_output()
+            resumed = self._resumed_tables()
+            for table_name in self._tables:
+                if table_name in resumed:
+                    self._emit(resumed[table_name])
+                else:
+                    self._emit(self._profile_table(cur, catalog, table_name))
+            self._finish()
+            self._close_output()
+        con.close()
+
+    def _load_catalog(self, cursor, schemas):
+        catalogs = dict([(schema, {'tables': {}, 'columns': {},
+                                   'constraints': {}, 'indexes': {}})
+                         for schema in schemas])
+        binds = {'schemas': list(schemas)}
+        for schema, tables in self._get_relations(cursor, binds):
+            catalogs[schema]['tables'] = tables
+        for schema, columns in self._get_columns(cursor, binds):
+            catalogs[schema]['columns'] = columns
+        for schema, constraints in self._get_constraints(cursor, binds):
+            catalogs[schema]['constraints'] = constraints
+        for schema, indexes in self._get_indexes(cursor, binds):
+            catalogs[schema]['indexes'] = indexes
+        return catalogs
+
+    def _get_relations(self, cursor, binds):
+        res = cursor.execute('''
+            SELECT n.nspname, c.relname,
+                   COALESCE(p.reltuples, c.reltuples),
+                   COALESCE(p.relation_size,
+                            pg_catalog.pg_relation_size(c.oid)),
+                   COALESCE(p.table_size, pg_catalog.pg_table_size(c.oid)),
+                   COALESCE(p.indexes_size,
+                            pg_catalog.pg_indexes_size(c.oid)),
+                   COALESCE(p.last_analyzed,
+                            GREATEST(s.last_analyze, s.last_autoanalyze))
+            FROM pg_catalog.pg_class c
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_catalog.pg_stat_all_tables s ON s.relid = c.oid
+            LEFT JOIN LATERAL (
+                SELECT CASE WHEN MIN(l.reltuples) < 0 THEN -1
+                            ELSE SUM(l.reltuples) END AS reltuples,
+                       SUM(pg_catalog.pg_relation_size(l.oid))::bigint
+                           AS relation_size,
+                       SUM(pg_catalog.pg_table_size(l.oid))::bigint
+                           AS table_size,
+                       SUM(pg_catalog.pg_indexes_size(l.oid))::bigint
+                           AS indexes_size,
+                       MAX(GREATEST(ls.last_analyze, ls.last_autoanalyze))
+                           AS last_analyzed
+                FROM pg_catalog.pg_partition_tree(c.oid) t
+                JOIN pg_catalog.pg_class l ON l.oid = t.relid
+                LEFT JOIN pg_catalog.pg_stat_all_tables ls
+                    ON ls.relid = l.oid
+                WHERE t.isleaf
+            ) p ON c.relkind = 'p'
+            WHERE n.nspname = ANY(:schemas)
+            AND c.relkind IN ('r', 'p')
+            AND NOT c.relispartition
+        ''', binds)
+        tables = {}
+        for r in res:
+            # reltuples is -1 (0 before 14) until the table is analyzed
+            num_rows = int(r[2]) if r[2] is not None and r[2] >= 0 else None
+            tables.setdefault(r[0], {})[r[1]] = {
+                'num_rows': num_rows,
+                'estimated_size': r[4],
+                'avg_row_len': (r[3] // num_rows if num_rows and r[3]
+                                else None),
+                # pg_table_size() also counts the free space and visibility
+                # maps, the rest of it is TOAST
+                'segment_sizes': {'table': r[3], 'lob': r[4] - r[3],
+                                  'index': r[5]},
+                'last_analyzed': format_dt(r[6])
+            }
+        return tables.items()
+
+    def _get_columns(self, cursor, binds):
+        res = cursor.execute('''
+            SELECT n.nspname, c.relname, a.attname,
+                   pg_catalog.format_type(a.atttypid, NULL), a.attnum,
+                   pg_catalog.col_description(c.oid, a.attnum),
+                   CASE WHEN a.atttypid = 'numeric'::regtype
+                        AND a.atttypmod >= 4
+                        THEN ((a.atttypmod - 4) >> 16) & 65535 END,
+                   CASE WHEN a.atttypid = 'numeric'::regtype
+                        AND a.atttypmod >= 4
+                        THEN (a.atttypmod - 4) & 65535 END,
+                   CASE WHEN a.atttypid IN ('character'::regtype,
+                                            'character varying'::regtype)
+                        AND a.atttypmod >= 4
+                        THEN a.atttypmod - 4 END,
+                   NOT a.attnotnull
+            FROM pg_catalog.pg_attribute a
+            JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = ANY(:schemas)
+            AND c.relkind IN ('r', 'p')
+            AND NOT c.relispartition
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+            ORDER BY n.nspname, c.relname, a.attnum
+        ''', binds)
+        columns = {}
+        for r in res:
+            columns.setdefault(r[0], {}).setdefault(r[1], []).append(
+                {'field': r[2], 'type': r[3], 'id': r[4], 'comment': r[5],
+                 'precision': r[6], 'scale': r[7], 'char_length': r[8],
+                 'nullable': r[9]})
+        return columns.items()
+
+    def _get_constraints(self, cursor, binds):
+        res = cursor.execute('''
+            SELECT n.nspname, c.relname, a.attname, con.contype
+            FROM pg_catalog.pg_constraint con
+            JOIN pg_catalog.pg_class c ON c.oid = con.conrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            CROSS JOIN LATERAL unnest(con.conkey)
+                WITH ORDINALITY AS k(attnum, position)
+            JOIN pg_catalog.pg_attribute a
+                ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+            WHERE n.nspname = ANY(:schemas)
+            AND NOT c.relispartition
+            AND con.contype IN ('p', 'u')
+            ORDER BY n.nspname, c.relname, con.conname, k.position
+        ''', binds)
+        constraints = {}
+        for r in res:
+            key = 'primary_keys' if r[3] == 'p' else 'unique_keys'
+            table = constraints.setdefault(r[0], {}).setdefault(
+                r[1], {'primary_keys': [], 'unique_keys': []})
+            table[key].append(r[2])
+        return constraints.items()
+
+    def _get_indexes(self, cursor, binds):
+        # expression index columns have attnum 0 and drop out of the join
+        res = cursor.execute('''
+            SELECT n.nspname, c.relname, a.attname, i.relname, ix.indisunique
+            FROM pg_catalog.pg_index ix
+            JOIN pg_catalog.pg_class c ON c.oid = ix.indrelid
+            JOIN pg_catalog.pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            CROSS JOIN LATERAL unnest(ix.indkey)
+                WITH ORDINALITY AS k(attnum, position)
+            JOIN pg_catalog.pg_attribute a
+                ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+            WHERE n.nspname = ANY(:schemas)
+            AND NOT c.relispartition
+            ORDER BY n.nspname, c.relname, i.relname, k.position
+        ''', binds)
+        indexes = {}
+        for r in res:
+            indexes.setdefault(r[0], {}).setdefault(r[1], []).append(
+                {'field': r[2],
+                 'uniqueness': 'UNIQUE' if r[4] else 'NONUNIQUE'})
+        return indexes.items()
+
+    def _profile_table(self, cursor, catalog, table_name):
+        start = time.time()
+        if self.tracer is not None:
+            cursor.start_table(table_name)
+        columns = catalog['columns'].get(table_name, [])
+        stats = catalog['tables'][table_name]
+        indexed_columns = catalog['indexes'].get(table_name, [])
+        unique_indexes = [i['field']
+                          for i in indexed_columns if
+                          i['uniqueness'] == 'UNIQUE']
+        keys = catalog['constraints'].get(table_name, {})
+        primary_keys = keys.get('primary_keys', [])
+        unique_keys = keys.get('unique_keys', [])
+        profile = {
+            'source': self.ds['name'].replace(' ', '_'),
+            'schema': self.ds['schema'],
+            'table': table_name,
+            'columns': columns,
+            'primary_keys': primary_keys,
+            'unique_keys': unique_keys,
+            'indexed_columns': indexed_columns,
+            'no_key': False if (primary_keys or unique_keys) else True,
+            'split_by': self._get_split_by(
+                columns, indexed_columns, primary_keys, unique_keys),
+            'num_rows': stats['num_rows'],
+            'avg_row_len': stats['avg_row_len'],
+            'estimated_size': stats['estimated_size'],
+            'size_source': 'segments',
+            'size_confidence': 'high',
+            'segment_sizes': stats['segment_sizes'],
+            'unique_indexes': unique_indexes,
+            'merge_key': self._get_merge_key(
+                columns, primary_keys, unique_keys, unique_indexes),
+            'check_column': self._get_check_column(indexed_columns, columns),
+            'partitioning': None,
+            'last_ddl_time': None,
+            'last_analyzed': stats['last_analyzed'],
+        }
+        if self.tracer is not None:
+            profile['timings'] = cursor.end_table(time.time() - start)
+        return profile
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#
+# SQLite store for profiler output.
+#
+# Every imported profiler output becomes a run. A run holds its datasources
+# and their table profiles, with the columns of every table in a table of
+# their own, so older runs stay available as history. Profiles are indexed
+# by source, table and size, which lets the job generator and the other
+# tools read a subset of the latest run without loading the whole dump.
+#
+# usage:
+#    profile_store profiles.db import profiler-output-*.json
+#    profile_store profiles.db runs
+
+import json
+import sqlite3
+import argparse
+from dataengineer_toolkit.dbprofiler.output import iter_tables
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    imported TEXT,
+    source_file TEXT
+);
+CREATE TABLE IF NOT EXISTS datasources (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs (id),
+    name TEXT,
+    schema TEXT,
+    header TEXT
+);
+CREATE TABLE IF NOT EXISTS tables (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs (id),
+    datasource_id INTEGER REFERENCES datasources (id),
+    source TEXT,
+    schema TEXT,
+    table_name TEXT,
+    estimated_size INTEGER,
+    num_rows INTEGER,
+    profile TEXT
+);
+CREATE TABLE IF NOT EXISTS columns (
+    table_id INTEGER REFERENCES tables (id),
+    field TEXT,
+    type TEXT,
+    position INTEGER
+);
+CREATE INDEX IF NOT EXISTS tables_source_ix
+    ON tables (run_id, source, table_name);
+CREATE INDEX IF NOT EXISTS tables_size_ix
+    ON tables (run_id, estimated_size);
+CREATE INDEX IF NOT EXISTS tables_history_ix
+    ON tables (source, schema, table_name);
+CREATE INDEX IF NOT EXISTS columns_table_ix ON columns (table_id);
+CREATE INDEX IF NOT EXISTS columns_field_ix ON columns (field);
+'''
+
+SQLITE_HEADER = 'SQLite format 3\x00'
+
+GB = 1024 * 1024 * 1024
+
+
+def is_store(fname):
+    with open(fname, 'rb') as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+class ProfileStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def import_file(self, fname):
+        """
+        Import a profiler output file, JSON or JSON lines, as a new run.
+        Returns the run id.
+        """
+        cur = self.db.cursor()
+        cur.execute("INSERT INTO runs (imported, source_file) "
+                    "VALUES (datetime('now'), ?)", (fname,))
+        run_id = cur.lastrowid
+        ds_ids = {}
+        for ds, table in iter_tables(fname):
+            if id(ds) not in ds_ids:
+                header = dict([(k, v) for k, v in ds.items()
+                               if k != 'tables'])
+                cur.execute(
+                    'INSERT INTO datasources (run_id, name, schema, header) '
+                    'VALUES (?, ?, ?, ?)',
+                    (run_id, ds['datasource']['name'],
+                     ds['datasource']['schema'], json.dumps(header)))
+                ds_ids[id(ds)] = (ds, cur.lastrowid)
+            self._add_table(cur, run_id, ds_ids[id(ds)][1], ds, table)
+        # JSON lines only carry profiling_metadata and errors in their end
+        # record, after the tables
+        for ds, ds_id in ds_ids.values():
+            header = dict([(k, v) for k, v in ds.items() if k != 'tables'])
+            cur.execute('UPDATE datasources SET header = ? WHERE id = ?',
+                        (json.dumps(header), ds_id))
+        self.db.commit()
+        return run_id
+
+    def _add_table(self, cur, run_id, ds_id, ds, table):
+        cur.execute(
+            'INSERT INTO tables (run_id, datasource_id, source, schema, '
+            'table_name, estimated_size, num_rows, profile) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_id, ds_id, ds['datasource']['name'],
+             ds['datasource']['schema'], table['table'],
+             table['estimated_size'], table['num_rows'],
+             json.dumps(table)))
+        table_id = cur.lastrowid
+        cur.executemany(
+            'INSERT INTO columns (table_id, field, type, position) '
+            'VALUES (?, ?, ?, ?)',
+            [(table_id, c['field'], c['type'], pos)
+             for pos, c in enumerate(table['columns'])])
+
+    def runs(self):
+        return self.db.execute(
+            'SELECT r.id, r.imported, r.source_file, COUNT(t.id) '
+            'FROM runs r LEFT JOIN tables t ON t.run_id = r.id '
+            'GROUP BY r.id ORDER BY r.id').fetchall()
+
+    def latest_run(self):
+        return self.db.execute('SELECT MAX(id) FROM runs').fetchone()[0]
+
+    def select_tables(self, run=None, sources=None, tables=None,
+                      min_size=None):
+        """
+        Yield ``(datasource, table)`` pairs of ``run``, the latest one by
+        default, like ``output.iter_tables``. ``sources`` limits them to
+        datasource names, ``tables`` to ``(source, table)`` pairs and
+        ``min_size`` to tables estimated at that many bytes or more.
+        """
+        if run is None:
+            run = self.latest_run()
+        sql = ['SELECT t.datasource_id, d.header, t.profile',
+               'FROM tables t JOIN datasources d ON d.id = t.datasource_id']
+        where = ['t.run_id = ?']
+        params = [run]
+        if tables is not None:
+            self.db.execute('CREATE TEMP TABLE IF NOT EXISTS wanted '
+                            '(source TEXT, table_name TEXT)')
+            self.db.execute('DELETE FROM wanted')
+            self.db.executemany('INSERT INTO wanted VALUES (?, ?)',
+                                [(s.upper(), t) for s, t in tables])
+            sql.append('JOIN wanted w ON w.source = UPPER(t.source) '
+                       'AND w.table_name = t.table_name')
+        if sources is not None:
+            where.append('UPPER(t.source) IN (%s)' % ', '.join(
+                ['?'] * len(sources)))
+            params.extend([s.upper() for s in sources])
+        if min_size is not None:
+            where.append('t.estimated_size >= ?')
+            params.append(min_size)
+        sql.append('WHERE ' + ' AND '.join(where))
+        sql.append('ORDER BY t.id')
+
+        headers = {}
+        for ds_id, header, profile in self.db.execute(' '.join(sql),
+                                                      params):
+            if ds_id not in headers:
+                headers[ds_id] = json.loads(header)
+            yield headers[ds_id], json.loads(profile)
+
+    def history(self, source, schema, table_name):
+        """
+        Profiles of one table across runs, oldest first, as
+        ``(run_id, profile)`` pairs.
+        """
+        res = self.db.execute(
+            'SELECT run_id, profile FROM tables '
+            'WHERE source = ? AND schema = ? AND table_name = ? '
+            'ORDER BY run_id', (source, schema, table_name))
+        return [(r[0], json.loads(r[1])) for r in res]
+
+
+def select_tables(fname, sources=None, tables=None, min_size=None):
+    """
+    Yield ``(datasource, table)`` pairs from a profile store (latest run)
+    or a profiler output file, limited as in ``ProfileStore.select_tables``.
+    A store does the filtering in SQL, output files are streamed through.
+    """
+    if is_store(fname):
+        store = ProfileStore(fname)
+        try:
+            for ds, table in store.select_tables(
+                    sources=sources, tables=tables, min_size=min_size):
+                yield ds, table
+        finally:
+            store.close()
+        return
+
+    if sources is not None:
+        sources = set([s.upper() for s in sources])
+    if tables is not None:
+        tables = set([(s.upper(), t) for s, t in tables])
+    for ds, table in iter_tables(fname):
+        source = ds['datasource']['name'].upper()
+        if sources is not None and source not in sources:
+            continue
+        if tables is not None and (source, table['table']) not in tables:
+            continue
+        if min_size is not None and (table['estimated_size'] is None or
+                                     table['estimated_size'] < min_size):
+            continue
+        yield ds, table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile store')
+    parser.add_argument('store', help='SQLite profile store')
+    commands = parser.add_subparsers(dest='command')
+    imp = commands.add_parser('import', help='Import profiler output')
+    imp.add_argument('files', nargs='+',
+                     help='JSON or JSON lines profiler output')
+    commands.add_parser('runs', help='List imported runs')
+    args = parser.parse_args()
+
+    store = ProfileStore(args.store)
+    if args.command == 'import':
+        for fname in args.files:
+            print 'IMPORTED %s as run %s' % (fname, store.import_file(fname))
+    elif args.command == 'runs':
+        for run_id, imported, source_file, count in store.runs():
+            print '%-6s %-20s %6s tables %s' % (run_id, imported, count,
+                                               source_file)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Timing instrumentation for the profiler.
+#
+# A TraceLog collects timed events from every profiler in a run:
+#
+#   {"kind": "query", "name": "_get_columns", "seconds": 0.012, "rows": 14,
+#    "datasource": "SRC", "schema": "S1", "table": "T1", "ts": ...}
+#
+# kinds are "tunnel", "connect", "query" and "table". Queries are named
+# after the profiler method issuing them. Events can be written to a JSON
+# lines trace file as they happen, and the slowest ones are reported at the
+# end of the run.
+
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class TraceLog(object):
+
+    def __init__(self, fname=None):
+        self.fname = fname
+        self._fp = open(fname, 'w') if fname else None
+        self._lock = threading.Lock()
+        self.events = []
+
+    def record(self, event):
+        with self._lock:
+            self.events.append(event)
+            if self._fp is not None:
+                self._fp.write(json.dumps(event) + '\n')
+
+    def top(self, kind, n=10):
+        events = [e for e in self.events if e['kind'] == kind]
+        return sorted(events, key=lambda e: e['seconds'], reverse=True)[:n]
+
+    def report(self, n=10):
+        print 'SLOWEST TABLES'
+        for e in self.top('table', n):
+            print '%-30s %-30s %-30s %10.3fs' % (
+                e['datasource'], e['schema'], e['table'], e['seconds'])
+        print 'SLOWEST QUERIES'
+        for e in self.top('query', n):
+            print '%-30s %-30s %-30s %-24s %10.3fs' % (
+                e['datasource'], e['schema'], e['table'] or '-', e['name'],
+                e['seconds'])
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+
+
+class Tracer(object):
+    """
+    Records events of one profiler into ``log``, tagged with the
+    datasource, and keeps per kind / name totals for its
+    ``profiling_metadata``.
+    """
+
+    def __init__(self, log, datasource, schema):
+        self.log = log
+        self.datasource = datasource
+        self.schema = schema
+        self._lock = threading.Lock()
+        self.summary = {}
+
+    def record(self, kind, name, seconds, table=None, **attrs):
+        event = {
+            'ts': time.time(),
+            'kind': kind,
+            'name': name,
+            'datasource': self.datasource,
+            'schema': self.schema,
+            'table': table,
+            'seconds': seconds
+        }
+        event.update(attrs)
+        self.log.record(event)
+        with self._lock:
+            total = self.summary.setdefault(kind, {}).setdefault(
+                name, {'count': 0, 'seconds': 0.0})
+            total['count'] += 1
+            total['seconds'] += seconds
+
+    @contextmanager
+    def span(self, kind, name, table=None):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.time() - start, table)
+
+    def cursor(self, cursor):
+        return TracingCursor(cursor, self)
+
+
+class TracingCursor(object):
+    """
+    Cursor wrapper timing every ``execute`` including the fetch of its
+    rows. Rows are fetched eagerly, so the result can be iterated or read
+    with ``fetchone`` / ``fetchall`` like a cursor.
+    """
+
+    def __init__(self, cursor, tracer):
+        self._cursor = cursor
+        self.tracer = tracer
+        self.table = None
+        self.queries = {}
+        self._rows = []
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name in ('arraysize', 'prefetchrows', 'deadline'):
+            setattr(self._cursor, name, value)
+        else:
+            object.__setattr__(self, name, value)
+
+    def start_table(self, table_name):
+        self.table = table_name
+        self.queries = {}
+
+    def end_table(self, seconds):
+        self.tracer.record('table', self.table, seconds, self.table)
+        timings = {'seconds': seconds, 'queries': self.queries}
+        self.table = None
+        self.queries = {}
+        return timings
+
+    def execute(self, sql, *args, **kwargs):
+        name = sys._getframe(1).f_code.co_name
+        start = time.time()
+        res = self._cursor.execute(sql, *args, **kwargs)
+        self._rows = list(res) if res is not None else []
+        seconds = time.time() - start
+        self.tracer.record('query', name, seconds, self.table,
+                           rows=len(self._rows))
+        if self.table is not None:
+            self.queries[name] = self.queries.get(name, 0.0) + seconds
+        return self
+
+    def __iter__(self):
+        rows, self._rows = self._rows, []
+        return iter(rows)
+
+    def fetchone(self):
+        if not self._rows:
+            return None
+        return self._rows.pop(0)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
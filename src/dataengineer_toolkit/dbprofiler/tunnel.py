@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Shared SSH tunnels.
+#
+# Datasources behind the same bastion share one SSH transport. Every remote
+# (ip, port) gets a forwarded local port on that transport, so the SSH
+# handshake is done once per bastion instead of once per datasource, and
+# profiles running in parallel can all go through it. Tunnels stay up until
+# the manager is closed, at the latest when the process exits.
+
+import sys
+import atexit
+import threading
+from sshtunnel import SSHTunnelForwarder
+
+
+class TunnelEndpoint(object):
+    """
+    Local end of a forwarded port. Works as a drop in for a single
+    ``SSHTunnelForwarder`` in ``with`` blocks, but leaving the block does
+    not stop the shared tunnel.
+    """
+
+    def __init__(self, manager, bastion, remote):
+        self.manager = manager
+        self.bastion = bastion
+        self.remote = remote
+        self.local_bind_host = None
+        self.local_bind_port = None
+
+    def __enter__(self):
+        self.local_bind_host, self.local_bind_port = self.manager.local_bind(
+            self.bastion, self.remote)
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class TunnelManager(object):
+
+    def __init__(self, keepalive=30):
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._bastions = {}
+        # remote addresses waiting for a tunnel, per bastion
+        self._pending = {}
+        # running forwarders per bastion, with the remotes each serves
+        self._forwarders = {}
+        # why a bastion's tunnel did not come up, raised again for every
+        # datasource behind it
+        self._errors = {}
+        atexit.register(self.close)
+
+    def endpoint(self, host, port, user, password, remote):
+        """
+        Register ``remote`` as ``(ip, port)`` reachable through the bastion
+        at ``host:port``. Nothing is opened until the endpoint is entered;
+        every remote registered by then shares the same transport.
+        """
+        bastion = (host, port, user)
+        remote = (remote[0], int(remote[1]))
+        with self._lock:
+            self._bastions[bastion] = password
+            pending = self._pending.setdefault(bastion, [])
+            if remote not in pending and not self._forwarder_for(
+                    bastion, remote):
+                pending.append(remote)
+        return TunnelEndpoint(self, bastion, remote)
+
+    def _forwarder_for(self, bastion, remote):
+        for forwarder, remotes in self._forwarders.get(bastion, []):
+            if remote in remotes:
+                return forwarder, remotes
+        return None
+
+    def _start(self, bastion):
+        if bastion in self._errors:
+            error = self._errors[bastion]
+            raise error[0], error[1], error[2]
+        host, port, user = bastion
+        remotes = self._pending[bastion]
+        try:
+            forwarder = SSHTunnelForwarder(
+                (host, port),
+                ssh_username=user,
+                ssh_password=self._bastions[bastion],
+                remote_bind_addresses=remotes,
+                set_keepalive=self.keepalive)
+            forwarder.start()
+        except Exception:
+            self._errors[bastion] = sys.exc_info()
+            raise
+        del self._pending[bastion]
+        self._forwarders.setdefault(bastion, []).append((forwarder, remotes))
+
+    def local_bind(self, bastion, remote):
+        with self._lock:
+            found = self._forwarder_for(bastion, remote)
+            if found is None:
+                # remotes registered after the bastion's first tunnel came
+                # up get a transport of their own
+                self._start(bastion)
+                found = self._forwarder_for(bastion, remote)
+            forwarder, remotes = found
+            if not forwarder.is_active:
+                forwarder.restart()
+            return forwarder.local_bind_addresses[remotes.index(remote)]
+
+    def close(self):
+        with self._lock:
+            for forwarders in self._forwarders.values():
+                for forwarder, remotes in forwarders:
+                    forwarder.stop()
+            self._forwarders = {}
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#
+# Artifact bundles.
+#
+# With generate_job --bundle, the artifacts of every artifacts/ directory
+# (a stage and a kind: oozie properties of a workflow, falcon processes,
+# falcon feeds) go to one zip file instead of a file each, e.g.
+# artifacts/dev-oozie-ingest-full.zip, so that they are copied and pushed
+# to HDFS as a few large files. artifacts/index.json maps every artifact,
+# by the path it would otherwise have, to its bundle and the byte range of
+# its zip entry, so that a single entity can be fetched with one ranged
+# read of its bundle, e.g. through WebHDFS OPEN with offset and length:
+#
+#   {"dev-oozie-ingest-full/SRC-SCHEMA-TABLE.properties":
+#    {"bundle": "dev-oozie-ingest-full.zip",
+#     "offset": 1234, "length": 567}}
+#
+# usage:
+#    python -m dataengineer_toolkit.job_generator.bundle artifacts/ \
+#        dev-oozie-ingest-full/SRC-SCHEMA-TABLE.properties
+
+import os
+import sys
+import json
+import glob
+import zlib
+import struct
+import shutil
+import zipfile
+
+INDEX = 'index.json'
+
+# where the bundles of the previous run are set aside while they are
+# written again
+PREVIOUS = '.previous'
+
+# entries carry a fixed timestamp, so that unchanged artifacts give the
+# same bundle bytes from one run to the next
+DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class Bundles(object):
+
+    def __init__(self, root):
+        self.root = root
+        self.index = {}
+        self._zips = {}
+
+    def add(self, path, content):
+        """
+        Add ``content`` as the artifact at ``path``, under ``root``, to the
+        bundle of its directory.
+        """
+        name = os.path.relpath(path, self.root)
+        directory, member = os.path.split(name)
+        bundle = '%s.zip' % directory
+        if bundle not in self._zips:
+            self._zips[bundle] = zipfile.ZipFile(
+                os.path.join(self.root, bundle), 'w', zipfile.ZIP_DEFLATED)
+        zf = self._zips[bundle]
+        info = zipfile.ZipInfo(member, DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0644 << 16
+        zf.writestr(info, content)
+        # the local header, the name and the compressed data
+        self.index[name] = {
+            'bundle': bundle,
+            'offset': info.header_offset,
+            'length': (zf.fp.tell() - info.header_offset)
+        }
+
+    def close(self):
+        for zf in self._zips.values():
+            zf.close()
+        # the index is written last and in one go, it marks the bundles
+        # complete, see set_aside()
+        path = os.path.join(self.root, INDEX)
+        with open(path + '.tmp', 'w') as f:
+            f.write(json.dumps(self.index, indent=4, sort_keys=True))
+        os.rename(path + '.tmp', path)
+
+
+def remove_bundles(root):
+    # bundles of a previous --bundle run
+    for path in glob.glob(os.path.join(root, '*.zip')):
+        os.remove(path)
+    if os.path.exists(os.path.join(root, INDEX)):
+        os.remove(os.path.join(root, INDEX))
+
+
+def set_aside(root):
+    """
+    Move the bundles and the index of the previous run under ``root`` to
+    its PREVIOUS directory, for the artifacts carried over to this run to
+    be read from with fetch_all(). Returns the directory.
+    """
+    previous = os.path.join(root, PREVIOUS)
+    if os.path.exists(previous) and not os.path.exists(
+            os.path.join(root, INDEX)):
+        # a run stopped before it wrote its index, its bundles are partial
+        # and the ones set aside are still the last complete set
+        remove_bundles(root)
+        return previous
+    if os.path.exists(previous):
+        shutil.rmtree(previous)
+    os.makedirs(previous)
+    paths = glob.glob(os.path.join(root, '*.zip'))
+    if os.path.exists(os.path.join(root, INDEX)):
+        paths.append(os.path.join(root, INDEX))
+    for path in paths:
+        os.rename(path, os.path.join(previous, os.path.basename(path)))
+    return previous
+
+
+def read_entry(data):
+    """
+    Content of a zip entry, from the bytes of its index range.
+    """
+    header = struct.unpack(zipfile.structFileHeader,
+                           data[:zipfile.sizeFileHeader])
+    method = header[zipfile._FH_COMPRESSION_METHOD]
+    start = (zipfile.sizeFileHeader + header[zipfile._FH_FILENAME_LENGTH] +
+             header[zipfile._FH_EXTRA_FIELD_LENGTH])
+    content = data[start:start + header[zipfile._FH_COMPRESSED_SIZE]]
+    if method == zipfile.ZIP_DEFLATED:
+        return zlib.decompressobj(-15).decompress(content)
+    return content
+
+
+def fetch_all(root, names):
+    """
+    Yield ``(name, content)`` of the artifacts ``names``, as listed in the
+    index of the bundles in ``root``.
+    """
+    with open(os.path.join(root, INDEX)) as f:
+        index = json.load(f)
+    for name in names:
+        entry = index[name]
+        with open(os.path.join(root, entry['bundle']), 'rb') as f:
+            f.seek(entry['offset'])
+            yield name, read_entry(f.read(entry['length']))
+
+
+def fetch(root, name):
+    """
+    Content of the artifact ``name``, as listed in the index of the bundles
+    in ``root``.
+    """
+    return list(fetch_all(root, [name]))[0][1]
+
+
+def main():
+    if len(sys.argv) != 3:
+        print 'usage: %s ARTIFACTS NAME' % sys.argv[0]
+        sys.exit(1)
+    sys.stdout.write(fetch(sys.argv[1], sys.argv[2]))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,21 @@ import argparse
 from collections import OrderedDict
 import os
 import shutil
+import multiprocessing
 from datetime import datetime, timedelta
 from dateutil.parser import parse as parse_date
 from jinja2 import Environment, PackageLoader, select_autoescape
 from ConfigParser import ConfigParser
 from RestrictedPython import compile_restricted
+from dataengineer_toolkit.dbprofiler.store import select_tables
+from dataengineer_toolkit.job_generator.planner import (get_throughput,
+                                                        plan_mappers)
+from dataengineer_toolkit.job_generator.partitions import plan_partitions
+from dataengineer_toolkit.job_generator.typemap import java_type
+from dataengineer_toolkit.job_generator.manifest import (Manifest, CHANGES,
+                                                         makedirs)
+from dataengineer_toolkit.job_generator.bundle import (Bundles, remove_bundles,
+                                                       set_aside, fetch_all)
 
 templates = Environment(
     loader=PackageLoader('dataengineer_toolkit.job_generator', 'templates'),
@@ -44,6 +54,8 @@ oozie_properties = OrderedDict([
     ('table', None),
     ('mapper', None),
     ('split_by', None),
+    ('split_by_expr', None),
+    ('boundary_query', None),
     ('merge_column', None),
     ('check_column', None),
 #    ('columns', None),
@@ -51,12 +63,9 @@ oozie_properties = OrderedDict([
     ('columns_java', None),
 ])
 
-JAVA_TYPE_MAP = {
-#    'VARCHAR2': 'String',
-    'DATE': 'String',
-#    'NUMBER': 'String',
-#    'CHAR': 'String',
-#    'LONG': 'Long',
+# jdbc_uri of sources other than oracle, by the profiler dialect
+JDBC_URIS = {
+    'postgresql': 'jdbc:postgresql://%(host)s:%(port)s/%(tns)s',
 }
 
 EXEC_TIME = {
@@ -102,15 +111,55 @@ ARTIFACTS='artifacts/'
 
 FOREVER=36135
 
+# tables handed to a --jobs worker at a time
+RENDER_CHUNK = 64
+
 def get_exec_time(source, process, schedules):
     return schedules.get(source, {}).get(process, '03:01')
 
 
+# manifest of the artifacts written, and the day the falcon entities are
+# scheduled from, kept from the first run so that rerunning the generator
+# leaves unchanged entities as they are. Set by main().
+_manifest = None
+_start_date = None
+
+# with --bundle, the artifacts rendered but not yet added to their bundle,
+# as (path, content) in the order they were written
+_bundled = None
+
+# generate_utc_time() results, by day, time and day offset
+_utc_times = {}
+
+
+def write_artifact(path, content):
+    if _bundled is not None:
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        if _manifest is not None:
+            _manifest.record(path, content)
+        _bundled.append((path, content))
+        return
+    if _manifest is not None:
+        _manifest.write(path, content)
+        return
+    makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
 def generate_utc_time(t, dayoffset=0):
-    tt = (datetime.now() + timedelta(days=dayoffset)).strftime('%Y-%m-%d')
-    dt = tt + ' %s' % t
-    start_dt = parse_date(dt)
-    return (start_dt - timedelta(hours=8)).strftime('%Y-%m-%dT%H:%MZ')
+    # every entity of a process or feed starts at the same time, parse it
+    # once
+    day = (_start_date or datetime.now()).date()
+    key = (day, t, dayoffset)
+    if key not in _utc_times:
+        tt = (day + timedelta(days=dayoffset)).strftime('%Y-%m-%d')
+        dt = tt + ' %s' % t
+        start_dt = parse_date(dt)
+        _utc_times[key] = (
+            start_dt - timedelta(hours=8)).strftime('%Y-%m-%dT%H:%MZ')
+    return _utc_times[key]
 
 
 def default_feed_name(stage, properties, feed):
@@ -123,19 +172,70 @@ def default_feed_name(stage, properties, feed):
 def default_process_name(stage, properties):
     return (
         stage + 
-        '-%(source_name)s-%(schema)s-%(table)s-%(workflow)s' % properties
+        '-%(source_name)s-%(schema)s-%(table)s-%(workflow)s' % properties +
+        ('-%s' % properties['partition_group']
+         if properties.get('partition_group') else '')
     ).replace('_','')
 
 
-def write_oozie_config(storedir, properties):
-    filename = '%(source_name)s-%(schema)s-%(table)s.properties' % properties
-    if not os.path.exists(storedir):
-        os.makedirs(storedir)
-    with open('%s/%s' % (storedir, filename), 'w') as f:
-        job = '\n'.join([
-            '%s=%s' % (k,v) for k,v in oozie_config(properties).items()
-        ])
-        f.write(job)
+def entity_name(properties):
+    name = '%(source_name)s-%(schema)s-%(table)s' % properties
+    if properties.get('partition_group'):
+        name += '-%s' % properties['partition_group']
+    return name
+
+
+def split_literal(value):
+    if isinstance(value, basestring):
+        return "TO_DATE('%s', 'YYYY-MM-DD HH24:MI:SS')" % value
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def split_scheme(table, mapper):
+    """
+    Build a balanced sqoop split from the split_by quantiles recorded by the
+    profiler. The split column is mapped to a bucket number through a CASE
+    expression so that, with a boundary query returning 1 and buckets + 1,
+    sqoop's integer splitter hands every mapper exactly one bucket of about
+    the same number of rows.
+
+    A value taking up more than a bucket's share of the rows would leave
+    fewer buckets than mappers, so the split is then a plain split on the
+    column instead, keeping every mapper planned. Returns
+    ``(split_by_expr, boundary_query)``, empty strings when the table has no
+    usable boundaries.
+    """
+    bounds = table.get('split_boundaries')
+    if not bounds or not bounds['values'] or mapper < 2:
+        return '', ''
+    values = bounds['values']
+    quantiles = len(values) - 1
+    cuts = []
+    for i in range(1, mapper):
+        value = values[int(round(i * quantiles / float(mapper)))]
+        if value != values[0] and value not in cuts:
+            cuts.append(value)
+    if len(cuts) + 1 < mapper:
+        return bounds['column'], ''
+    # only '>=' comparisons, the expression ends up in falcon XML attributes
+    whens = ['WHEN %s >= %s THEN %d' % (bounds['column'], split_literal(cut),
+                                         bucket)
+             for bucket, cut in reversed(list(enumerate(cuts, 2)))]
+    split_by_expr = 'CASE %s ELSE 1 END' % ' '.join(whens)
+    boundary_query = 'SELECT 1, %d FROM DUAL' % (len(cuts) + 2)
+    return split_by_expr, boundary_query
+
+
+def write_oozie_config(storedir, properties, config=None):
+    filename = '%s.properties' % entity_name(properties)
+    if config is None:
+        config = oozie_config(properties)
+    job = '\n'.join([
+        '%s=%s' % (k,v) for k,v in config.items()
+    ])
+    write_artifact('%s/%s' % (storedir, filename), job)
 
 
 def oozie_config(properties):
@@ -143,34 +243,43 @@ def oozie_config(properties):
     prop['jdbc_uri'] = prop['jdbc_uri'] % properties
     prop['oozie.wf.application.path'] = properties['wfpath']
     for k,v in prop.items():
-        if k in properties.keys():
+        if k in properties:
             prop[k] = properties[k]
     prop['appName'] = (
         properties.get('appName', None) or 
         '%(workflow)s-%(source_name)s-%(schema)s-%(table)s' % properties
     )
+    if properties.get('partition_group'):
+        # oraoop only imports the listed partitions, into a directory of
+        # their own
+        prop['appName'] += '-%s' % properties['partition_group']
+        prop['partitions'] = properties['partitions']
+        prop['outputdir'] = properties['outputdir']
+    if properties.get('partition_groups'):
+        # the table level job only merges the partition groups
+        prop['partition_groups'] = properties['partition_groups']
     return prop
 
 
 def write_falcon_process(storedir, stage, properties, in_feeds=None,
-        out_feeds=None, process_time='05:00'):
-    filename = '%(source_name)s-%(schema)s-%(table)s.xml' % properties
-    if not os.path.exists(storedir):
-        os.makedirs(storedir)
-    with open('%s/%s' % (storedir, filename), 'w') as f:
-        params, job = falcon_process(stage, properties, in_feeds, out_feeds,
-                process_time)
-        f.write(job)
+        out_feeds=None, process_time='05:00', config=None, feed_names=None):
+    filename = '%s.xml' % entity_name(properties)
+    params, job = falcon_process(stage, properties, in_feeds, out_feeds,
+            process_time, config, feed_names)
+    write_artifact('%s/%s' % (storedir, filename), job)
 
 
 def falcon_process(stage, properties, in_feeds=None, out_feeds=None,
-        process_time='05:00'):
+        process_time='05:00', config=None, feed_names=None):
+    # config and feed_names, the oozie_config() of properties and the
+    # default_feed_name() of the feeds, when the caller has them already
+    feed_names = feed_names or {}
     inputs = [
-        default_feed_name(stage, properties, 
+        feed_names.get(i) or default_feed_name(stage, properties, 
             i) for  i in (in_feeds or [])
         ]
     outputs = [
-        default_feed_name(stage, properties, 
+        feed_names.get(i) or default_feed_name(stage, properties, 
             i) for  i in (out_feeds or [])
         ]
     inputs_xml = '\n        '.join(
@@ -182,7 +291,7 @@ def falcon_process(stage, properties, in_feeds=None, out_feeds=None,
                 (t,i) for t,i in enumerate(outputs)])
     outputs_xml = '<outputs>%s</outputs>' % outputs_xml if outputs_xml else ''
 
-    prop = oozie_config(properties)
+    prop = config if config is not None else oozie_config(properties)
     params = {
         'schema': properties['schema'],
         'table': properties['table'],
@@ -205,18 +314,15 @@ def falcon_process(stage, properties, in_feeds=None, out_feeds=None,
 
 
 def write_falcon_feed(storedir, stage, properties, feed, feed_path, 
-        feed_format, exec_time='00:00', retention=FOREVER):
+        feed_format, exec_time='00:00', retention=FOREVER, feed_name=None):
     filename = '%(source_name)s-%(schema)s-%(table)s.xml' % properties
-    if not os.path.exists(storedir):
-        os.makedirs(storedir)
-    with open('%s/%s' % (storedir, filename), 'w') as f:
-        params, job = falcon_feed(stage, properties, feed, 
-                    feed_path, feed_format, exec_time, retention)
-        f.write(job)
+    params, job = falcon_feed(stage, properties, feed, 
+                feed_path, feed_format, exec_time, retention, feed_name)
+    write_artifact('%s/%s' % (storedir, filename), job)
 
 
 def falcon_feed(stage, properties, feed, feed_path, feed_format, 
-            exec_time='00:00', retention=FOREVER):
+            exec_time='00:00', retention=FOREVER, feed_name=None):
     if retention is not None:
         rt = "<retention limit='days(%s)' action='delete'/>" % retention
     else:
@@ -226,7 +332,7 @@ def falcon_feed(stage, properties, feed, feed_path, feed_format,
        'table': properties['table'],
        'source_name': properties['source_name'],
        'start_utc': generate_utc_time(exec_time),
-       'feed_name': default_feed_name(stage, properties, feed), 
+       'feed_name': feed_name or default_feed_name(stage, properties, feed),
        'feed_path': feed_path.format(**properties),
        'feed_type': feed,
        'feed_format': feed_format,
@@ -238,19 +344,17 @@ def falcon_feed(stage, properties, feed, feed_path, feed_format,
 
 
 def write_falcon_hivefeed(storedir, stage, properties, feed, feed_path, 
-                          feed_format, exec_time='00:00', retention=FOREVER):
+                          feed_format, exec_time='00:00', retention=FOREVER,
+                          feed_name=None):
     filename = '%(source_name)s-%(schema)s-%(table)s.xml' % properties
-    if not os.path.exists(storedir):
-        os.makedirs(storedir)
-    with open('%s/%s' % (storedir, filename), 'w') as f:
-        params, job = falcon_hivefeed(
-                        stage, properties, feed, 
-                        feed_path, feed_format, exec_time, retention)
-        f.write(job)
+    params, job = falcon_hivefeed(
+                    stage, properties, feed, 
+                    feed_path, feed_format, exec_time, retention, feed_name)
+    write_artifact('%s/%s' % (storedir, filename), job)
 
 
 def falcon_hivefeed(stage, properties, feed, feed_path, feed_format, 
-                    exec_time='00:00', retention=FOREVER):
+                    exec_time='00:00', retention=FOREVER, feed_name=None):
     if retention is not None:
         rt = "<retention limit='days(%s)' action='delete'/>" % retention
     else:
@@ -260,7 +364,7 @@ def falcon_hivefeed(stage, properties, feed, feed_path, feed_format,
        'table': properties['table'],
        'source_name': properties['source_name'],
        'start_utc': generate_utc_time(exec_time),
-       'feed_name': default_feed_name(stage, properties, feed), 
+       'feed_name': feed_name or default_feed_name(stage, properties, feed),
        'feed_path': feed_path.format(**properties),
        'feed_type': feed,
        'feed_format': feed_format,
@@ -271,10 +375,320 @@ def falcon_hivefeed(stage, properties, feed, feed_path, feed_format,
     return params, job
 
 
+def write_partition_jobs(stage, process, proc_opts, properties, groups,
+                         schedules, feed_names=None):
+    # every group lands in the CURRENT of its own PARTITION=<group>
+    # directory. Frozen groups only get their oozie properties, under a
+    # -frozen directory, to be run once by hand. The others are scheduled
+    # like table level jobs, each with a feed of its own. The table level
+    # job waits on these feeds and merges all groups into the table's
+    # CURRENT, for the table's feeds and the transform to pick up.
+    wf = properties['workflow']
+    feed_names = dict(feed_names or {})
+    group_feeds = []
+    for group in groups:
+        opts = properties.copy()
+        opts['partition_group'] = group['name']
+        opts['partitions'] = ','.join(group['partitions'])
+        opts['outputdir'] = '%s/source/%s/%s_%s/PARTITION=%s' % (
+            opts['prefix'], opts['source_name'], opts['schema'],
+            opts['table'], group['name'])
+        opts['mapper'] = group['mapper']
+        opts['split_by_expr'] = ''
+        opts['boundary_query'] = ''
+        config = oozie_config(opts)
+        if group['frozen']:
+            write_oozie_config('%s/%s-oozie-%s-frozen' % (
+                ARTIFACTS, stage, wf), opts, config)
+            continue
+        feed = 'partition-%s' % group['name']
+        feed_names[feed] = default_feed_name(stage, opts, feed)
+        params, job = falcon_feed(stage, opts, 'partition',
+                                  '{outputdir}/CURRENT', 'parquet',
+                                  feed_name=feed_names[feed])
+        write_artifact('%s/%s-falconfeed-partition/%s.xml' % (
+            ARTIFACTS, stage, entity_name(opts)), job)
+        group_feeds.append(feed)
+        write_oozie_config('%s/%s-oozie-%s' % (ARTIFACTS, stage, wf), opts,
+                           config)
+        write_falcon_process(
+            '%s/%s-falconprocess-%s' % (ARTIFACTS, stage, wf), stage, opts,
+            proc_opts.get('in_feeds', []), [feed],
+            get_exec_time(opts['source_name'], process, schedules),
+            config, feed_names)
+
+    # the merge takes the schema of the first group, which has to exist,
+    # so scheduled groups are listed before the frozen ones
+    opts = properties.copy()
+    opts['partition_groups'] = ','.join(
+        [g['name'] for g in groups if not g['frozen']] +
+        [g['name'] for g in groups if g['frozen']])
+    config = oozie_config(opts)
+    write_oozie_config('%s/%s-oozie-%s' % (ARTIFACTS, stage, wf), opts,
+                       config)
+    write_falcon_process(
+        '%s/%s-falconprocess-%s' % (ARTIFACTS, stage, wf), stage, opts,
+        proc_opts.get('in_feeds', []) + group_feeds,
+        proc_opts.get('out_feeds', []),
+        get_exec_time(opts['source_name'], process, schedules),
+        config, feed_names)
+
+
+def stage_context(stage, conf, params, feeds):
+    """
+    Properties of a table in one stage, and the names of its ``feeds``, as
+    shared by the hive statement and all processes and feeds of the stage.
+    """
+    properties = params.copy()
+    properties['prefix'] = conf['prefix']
+    properties['targetdb'] = conf['targetdb'].format(**params)
+    feed_names = dict([(feed, default_feed_name(stage, properties, feed))
+                       for feed in feeds])
+    return properties, feed_names
+
+
+def table_key(ds, table):
+    # a table in the manifest
+    return '%s.%s.%s' % (ds['datasource']['name'], ds['datasource']['schema'],
+                         table['table'])
+
+
+def table_params(ctx, ds, table):
+    """
+    Plan the mappers and partition jobs of one profiled table. Returns
+    ``(plan_rows, params, partition_groups)``, the rows of the mapper plan,
+    the properties of the table common to all stages and the partition
+    groups, None for table level jobs.
+    """
+    plan_rows = []
+    source_name = ds['datasource']['name'].replace(' ','_')
+    throughputs = ctx['throughputs']
+    partitioning = ctx['partitioning']
+    if source_name not in throughputs:
+        throughputs[source_name] = get_throughput(ctx['cfg'], source_name)
+    mapper, plan = plan_mappers(table, ds['direct'],
+                                throughputs[source_name])
+    # direct imports split by oraoop's own chunks
+    split_by_expr, boundary_query = '', ''
+    if not ds['direct']:
+        split_by_expr, boundary_query = split_scheme(table, mapper)
+    plan_rows.append([
+        source_name, ds['datasource']['schema'], table['table'],
+        plan['estimated_size'], plan['num_rows'],
+        ' '.join(plan['lob_columns']), plan['direct'],
+        plan['single_mapper_seconds'], mapper,
+        plan['estimated_seconds'], '; '.join(plan['reasons'])])
+    columns = [c['field'] for c in table['columns']]
+    columns_java = []
+    for c in table['columns']:
+        java = java_type(c)
+        if java is not None:
+            columns_java.append('%s=%s' % (c['field'], java))
+
+    username = ds['datasource']['login']
+    password = ds['datasource']['password']
+
+    params = {
+        'mapper': mapper, 
+        'source_name': source_name,
+        'host': ds['datasource']['ip'],
+        'port': ds['datasource']['port'],
+        'username': username, # ds['datasource']['login'],
+        'password': password,
+        'tns': ds['datasource']['tns'],
+        'schema': ds['datasource']['schema'],
+        'table': table['table'],
+        'split_by': table['split_by'],
+        'split_by_expr': split_by_expr,
+        'boundary_query': boundary_query,
+        'columns_java': ','.join(columns_java),
+        'columns': ','.join(['`%s`' % c['field'] for c in table['columns']]),
+        'merge_column': table['merge_key'],
+        'check_column': table['check_column'],
+        'direct': ds['direct']
+    }
+    if ds.get('dialect') in JDBC_URIS:
+        params['jdbc_uri'] = JDBC_URIS[ds['dialect']] % params
+
+    # partition jobs rely on oraoop, so only for direct capable sources
+    partition_groups = None
+    if (partitioning['mode'] != 'table' and ds['direct'] and
+            (table['estimated_size'] or 0) >= partitioning['min_size']):
+        partition_groups = plan_partitions(
+            table, partitioning['mode'], partitioning['group_size'],
+            partitioning['frozen_before'])
+    for group in partition_groups or []:
+        group['mapper'], group_plan = plan_mappers(
+            {'columns': table['columns'], 'num_rows': group['num_rows'],
+             'estimated_size': group['estimated_size']},
+            ds['direct'], throughputs[source_name])
+        plan_rows.append([
+            source_name, ds['datasource']['schema'],
+            '%s/%s' % (table['table'], group['name']),
+            group_plan['estimated_size'], group_plan['num_rows'],
+            ' '.join(group_plan['lob_columns']), group_plan['direct'],
+            group_plan['single_mapper_seconds'], group['mapper'],
+            group_plan['estimated_seconds'],
+            '; '.join(group_plan['reasons'])])
+    return plan_rows, params, partition_groups
+
+
+def render_table(ctx, ds, table):
+    """
+    Write the oozie and falcon artifacts of one profiled table, with the
+    stages, processes, feeds and schedules of the config in ``ctx``.
+
+    Returns ``(plan_rows, hive_create)``, the rows of the mapper plan and
+    the hive statements of the table, for the caller to write out in table
+    order.
+    """
+    if _manifest is not None:
+        _manifest.table = table_key(ds, table)
+    plan_rows, params, partition_groups = table_params(ctx, ds, table)
+    hive_create = []
+    partitioning = ctx['partitioning']
+    schedules = ctx['schedules']
+    feed_ids = set(ctx['feeds']) | set(ctx['hive_feeds'])
+    for proc_opts in ctx['processes'].values():
+        feed_ids.update(proc_opts.get('in_feeds', []))
+        feed_ids.update(proc_opts.get('out_feeds', []))
+    for stage, conf in ctx['stages'].items():
+        properties, feed_names = stage_context(stage, conf, params, feed_ids)
+
+        if stage in ['prod']:
+            hive_create.append(
+                hive_create_template.render(**properties)
+            )
+
+        for process, proc_opts in ctx['processes'].items():
+            if not proc_opts.get('condition', lambda x: True):
+                continue
+            opts = properties.copy()
+            wf = proc_opts['workflow']
+            opts['workflow'] = wf
+            opts['wfpath'] = os.path.join(conf['prefix'], 'workflows', wf)
+
+            if partition_groups and wf in partitioning['workflows']:
+                write_partition_jobs(stage, process, proc_opts, opts,
+                                     partition_groups, schedules, feed_names)
+                continue
+
+            config = oozie_config(opts)
+            storedir = '%s/%s-oozie-%s' % (ARTIFACTS, stage, wf)
+            write_oozie_config(storedir, opts, config)
+            storedir = '%s/%s-falconprocess-%s' % (ARTIFACTS, stage, wf)
+            write_falcon_process(storedir, stage, opts,
+                proc_opts.get('in_feeds', []), 
+                proc_opts.get('out_feeds', []),
+                get_exec_time(opts['source_name'], process, schedules),
+                config, feed_names
+            )
+
+        for feed, feed_opts in ctx['feeds'].items():
+            storedir = '%s/%s-falconfeed-%s' % (ARTIFACTS, stage, feed)
+            write_falcon_feed(storedir, stage, properties, feed,
+                            feed_opts['path'], feed_opts['format'],
+                            feed_opts['exec_time'],
+                            feed_opts.get('retention', FOREVER),
+                            feed_names[feed])
+
+        for feed, feed_opts in ctx['hive_feeds'].items():
+            storedir = '%s/%s-falconfeed-%s' % (ARTIFACTS, stage, feed)
+            write_falcon_hivefeed(storedir, stage, properties, feed,
+                            feed_opts['path'], feed_opts['format'],
+                            feed_opts['exec_time'],
+                            feed_opts.get('retention', FOREVER),
+                            feed_names[feed])
+    return plan_rows, hive_create
+
+
+# render_table() context of the --jobs workers, inherited through fork()
+# as the compiled process conditions do not pickle
+_context = None
+
+
+def _render_chunk(chunk):
+    # the artifacts a worker writes go back to the manifest of main(), and
+    # with --bundle their content as well, for main() to add in order
+    _manifest.current = {}
+    _manifest.tables = {}
+    if _bundled is not None:
+        del _bundled[:]
+    results = [render_table(_context, ds, table) for ds, table in chunk]
+    return results, _manifest.current, _manifest.tables, _bundled
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _merge_chunks(chunks):
+    for results, artifacts, tables, bundled in chunks:
+        _manifest.current.update(artifacts)
+        _manifest.tables.update(tables)
+        if bundled is not None:
+            _bundled.extend(bundled)
+        for result in results:
+            yield result
+
+
+def _profiled_tables(tables, skipped):
+    for ds, table in tables:
+        if table.get('error'):
+            # the profile timed out and may miss columns, keys or split
+            # boundaries, the artifacts of the previous run are kept
+            print 'SKIPPED %s.%s: %s' % (ds['datasource']['name'],
+                                         table['table'], table['error'])
+            skipped.append(table_key(ds, table))
+            continue
+        yield ds, table
+
+
+def _out_of_scope(profilerjson, sources, min_size):
+    # tables of the previous run that a run limited to sources and min_size
+    # does not render, and whose artifacts it leaves as they are. Tables
+    # gone from the profiles of the sources are in scope, and removed.
+    keys = set()
+    if sources is not None:
+        prefixes = tuple('%s.' % s.upper() for s in sources)
+        keys.update(k for k in _manifest.previous_tables
+                    if not k.upper().startswith(prefixes))
+    if min_size is not None:
+        for ds, table in select_tables(profilerjson, sources=sources):
+            if (table['estimated_size'] is None or
+                    table['estimated_size'] < min_size):
+                keys.add(table_key(ds, table))
+    return keys
+
+
 def main():
     argparser = argparse.ArgumentParser(description='Generate oozie and falcon configurations for ingestion')
-    argparser.add_argument('profilerjson', help='JSON output from oracle_profiler.py')
+    argparser.add_argument('profilerjson', help='JSON or JSON lines output from oracle_profiler.py, or a profile store')
     argparser.add_argument('-c', '--config', help='Config file', default=None)
+    argparser.add_argument('-s', '--source', action='append', default=None,
+                           help='Only generate jobs for this source, can be repeated')
+    argparser.add_argument('--min-size-gb', type=float, default=None,
+                           help='Only generate jobs for tables of at least this size')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='Render the artifacts in this many processes')
+    argparser.add_argument('--start-date', default=None,
+                           help='Schedule the falcon entities from this day '
+                                '(YYYY-MM-DD), instead of the day of the '
+                                'first run')
+    argparser.add_argument('--clean', action='store_true',
+                           help='Remove the previous artifacts and write '
+                                'them all again')
+    argparser.add_argument('--bundle', action='store_true',
+                           help='Write the artifacts to a zip file per '
+                                'directory, with an index.json, instead of '
+                                'a file each')
     opts = argparser.parse_args()
     hive_create = []
 
@@ -317,6 +731,26 @@ def main():
         feeds[feed]['format'] = 'parquet'
         feeds[feed]['exec_time'] = '00:00'
 
+    partitioning = {'mode': 'table'}
+    if cfg.has_section('partitioning'):
+        partitioning['mode'] = cfg.get('partitioning', 'mode')
+        partitioning['group_size'] = None
+        if cfg.has_option('partitioning', 'group_size_gb'):
+            partitioning['group_size'] = cfg.getfloat(
+                'partitioning', 'group_size_gb') * 1024 * 1024 * 1024
+        partitioning['min_size'] = 0
+        if cfg.has_option('partitioning', 'min_size_gb'):
+            partitioning['min_size'] = cfg.getfloat(
+                'partitioning', 'min_size_gb') * 1024 * 1024 * 1024
+        partitioning['frozen_before'] = None
+        if cfg.has_option('partitioning', 'frozen_days'):
+            partitioning['frozen_before'] = datetime.now() - timedelta(
+                days=cfg.getint('partitioning', 'frozen_days'))
+        partitioning['workflows'] = ['ingest-full']
+        if cfg.has_option('partitioning', 'workflows'):
+            partitioning['workflows'] = cfg.get(
+                'partitioning', 'workflows').strip().split()
+
     hive_feeds = {}
     for feedkey in [x for x in cfg.sections() if x.startswith('hive_feed:')]:
         feed = feedkey.split(':')[1]
@@ -336,98 +770,106 @@ def main():
 
     import csv
 
-    if os.path.exists(ARTIFACTS):
+    mapper_plan = csv.writer(open('mapper-plan.csv', 'w'))
+    mapper_plan.writerow(['source', 'schema', 'table', 'estimated_size',
+                          'num_rows', 'lob_columns', 'direct',
+                          'single_mapper_seconds', 'mapper',
+                          'estimated_seconds', 'reasons'])
+
+    # without a manifest, the artifacts there are not known to be ours
+    global _manifest, _start_date, _bundled
+    _manifest = Manifest(ARTIFACTS)
+    if (opts.clean or not _manifest.exists()) and os.path.exists(ARTIFACTS):
         shutil.rmtree(ARTIFACTS)
-    for ds in json.loads(open(opts.profilerjson).read()):
-        for table in ds['tables']:
-
-            mapper = int((table['estimated_size'] or 0) / 1024 / 1024 / 1024) or 2
-            if mapper < 2:
-                mapper = 2
-            if mapper > 25:
-                mapper = 25
-            columns = [c['field'] for c in table['columns']]
-            columns_create = []
-            columns_java = []
-            for c in table['columns']:
-                if JAVA_TYPE_MAP.get(c['type'], None):
-                    columns_java.append('%s=%s' % (c['field'], JAVA_TYPE_MAP[c['type']]))
-
-            source_name = ds['datasource']['name'].replace(' ','_')
-            username = ds['datasource']['login']
-            password = ds['datasource']['password']
-
-            params = {
-                'mapper': mapper, 
-                'source_name': source_name,
-                'host': ds['datasource']['ip'],
-                'port': ds['datasource']['port'],
-                'username': username, # ds['datasource']['login'],
-                'password': password,
-                'tns': ds['datasource']['tns'],
-                'schema': ds['datasource']['schema'],
-                'table': table['table'],
-                'split_by': table['split_by'],
-                'columns_java': ','.join(columns_java),
-                'columns_create': ','.join(columns_create),
-                'columns_create_newline': ',\n    '.join(columns_create),
-                'columns': ','.join(['`%s`' % c['field'] for c in table['columns']]),
-                'merge_column': table['merge_key'],
-                'check_column': table['check_column'],
-                'direct': ds['direct']
-            }
-
-            for stage, conf in stages.items():
-
-                if stage in ['prod']:
-                    opts = params.copy()
-                    opts['targetdb'] = conf['targetdb'].format(**params)
-                    opts['prefix'] = conf['prefix']
-                    hive_create.append(
-                        hive_create_template.render(**opts)
-                    )
-
-                for process, proc_opts in processes.items():
-                    opts = params.copy()
-                    opts['prefix'] = conf['prefix']
-                    opts['targetdb'] = conf['targetdb'].format(**params)
-
-                    wf = proc_opts['workflow']
-                    opts['workflow'] = wf
-                    opts['wfpath'] = os.path.join(conf['prefix'], 'workflows', wf)
-                    if not proc_opts.get('condition', lambda x: True):
-                        continue
-
-                    storedir = '%s/%s-oozie-%s' % (ARTIFACTS, stage, wf)
-                    write_oozie_config(storedir, opts)
-                    storedir = '%s/%s-falconprocess-%s' % (ARTIFACTS, stage, wf)
-                    write_falcon_process(storedir, stage, opts,
-                        proc_opts.get('in_feeds', []), 
-                        proc_opts.get('out_feeds', []),
-                        get_exec_time(opts['source_name'], process, schedules)
-                    )
-
-                for feed, feed_opts in feeds.items():
-                    opts = params.copy()
-                    opts['prefix'] = conf['prefix']
-                    storedir = '%s/%s-falconfeed-%s' % (ARTIFACTS, stage, feed)
-                    write_falcon_feed(storedir, stage, opts, feed,
-                                    feed_opts['path'], feed_opts['format'],
-                                    feed_opts['exec_time'],
-                                    feed_opts.get('retention', FOREVER))
-
-                for feed, feed_opts in hive_feeds.items():
-                    opts = params.copy()
-                    opts['prefix'] = conf['prefix']
-                    opts['targetdb'] = conf['targetdb'].format(**params)
-                    storedir = '%s/%s-falconfeed-%s' % (ARTIFACTS, stage, feed)
-                    write_falcon_hivefeed(storedir, stage, opts, feed,
-                                    feed_opts['path'], feed_opts['format'],
-                                    feed_opts['exec_time'],
-                                    feed_opts.get('retention', FOREVER))
+        _manifest = Manifest(ARTIFACTS)
+    if opts.start_date:
+        _manifest.start_date = opts.start_date
+    elif not _manifest.start_date:
+        _manifest.start_date = datetime.now().strftime('%Y-%m-%d')
+    _start_date = datetime.strptime(_manifest.start_date, '%Y-%m-%d')
+    # unchanged artifacts are not written again, switching between files
+    # and bundles has to write them all
+    if _manifest.previous and _manifest.bundled != opts.bundle:
+        raise Exception('The artifacts in %s were written %s --bundle, '
+                        'rerun with --clean to switch' % (
+                            ARTIFACTS,
+                            'with' if _manifest.bundled else 'without'))
+    _manifest.bundled = opts.bundle
+    # bundles are written from scratch every run, the previous ones are
+    # set aside for the artifacts carried over
+    previous_bundles = None
+    bundles = None
+    if opts.bundle:
+        makedirs(ARTIFACTS)
+        previous_bundles = set_aside(ARTIFACTS)
+        bundles = Bundles(ARTIFACTS)
+        _bundled = []
+    else:
+        remove_bundles(ARTIFACTS)
+    min_size = None
+    if opts.min_size_gb is not None:
+        min_size = opts.min_size_gb * 1024 * 1024 * 1024
+    out_of_scope = set()
+    if opts.source is not None or min_size is not None:
+        if _manifest.previous and not _manifest.previous_tables:
+            raise Exception('%s does not list the artifacts by table, run '
+                            'once without --source and --min-size-gb'
+                            % _manifest.path)
+        out_of_scope = _out_of_scope(opts.profilerjson, opts.source,
+                                     min_size)
+    context = {
+        'cfg': cfg,
+        'stages': stages,
+        'processes': processes,
+        'feeds': feeds,
+        'hive_feeds': hive_feeds,
+        'schedules': schedules,
+        'partitioning': partitioning,
+        'throughputs': {},
+    }
+    skipped = []
+    tables = _profiled_tables(select_tables(
+        opts.profilerjson, sources=opts.source, min_size=min_size), skipped)
+    pool = None
+    if opts.jobs > 1:
+        # workers render and write the artifacts of a chunk of tables
+        # each, the mapper plan and hive statements come back in table
+        # order, so that the output is the same as without --jobs
+        global _context
+        _context = context
+        pool = multiprocessing.Pool(opts.jobs)
+        results = _merge_chunks(pool.imap(_render_chunk,
+                                          _chunks(tables, RENDER_CHUNK)))
+    else:
+        results = (render_table(context, ds, table) for ds, table in tables)
+    for plan_rows, table_hive_create in results:
+        mapper_plan.writerows(plan_rows)
+        hive_create.extend(table_hive_create)
+        if bundles is not None:
+            for path, content in _bundled:
+                bundles.add(path, content)
+            del _bundled[:]
+    if pool is not None:
+        pool.close()
+        pool.join()
+    kept = []
+    for key in skipped + sorted(out_of_scope):
+        kept.extend(_manifest.keep(key))
+    if bundles is not None:
+        if kept:
+            for name, content in fetch_all(previous_bundles, sorted(kept)):
+                bundles.add(os.path.join(ARTIFACTS, name), content)
+        bundles.close()
+        shutil.rmtree(previous_bundles)
 
     open('hive-create.sql', 'w').write('\n'.join(hive_create))
 
+    _manifest.remove_stale()
+    changes = _manifest.save()
+    print 'ARTIFACTS %d added, %d changed, %d removed, see %s' % (
+        len(changes['added']), len(changes['changed']),
+        len(changes['removed']), os.path.join(ARTIFACTS, CHANGES))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Content hash manifest of the generated artifacts.
+#
+# The generator keeps the SHA-1 of every artifact it wrote in a manifest
+# next to them. On the next run a file is only written when its content
+# changed, the files no longer produced are removed, and the added, changed
+# and removed artifacts are listed for the deployer, so that only those get
+# pushed and resubmitted to falcon. The manifest also lists the artifacts of
+# every table, so that those of a table not rendered again, e.g. because its
+# profile timed out, are carried over as they are.
+
+import os
+import json
+import errno
+import hashlib
+
+from dataengineer_toolkit.job_generator.bundle import INDEX
+
+MANIFEST = 'manifest.json'
+CHANGES = 'changes.json'
+
+
+def makedirs(path):
+    # with --jobs, several workers may create the same directory
+    try:
+        os.makedirs(path)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+class Manifest(object):
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST)
+        self.previous = {}
+        self.previous_tables = {}
+        self.start_date = None
+        # whether the artifacts go to bundles, see bundle.py
+        self.bundled = False
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                manifest = json.load(f)
+            self.previous = manifest['artifacts']
+            self.previous_tables = manifest.get('tables', {})
+            self.start_date = manifest['start_date']
+            # manifests that do not say were bundled if there is an index
+            self.bundled = manifest.get(
+                'bundled', os.path.exists(os.path.join(root, INDEX)))
+        # artifacts written by this run, by path relative to root, and their
+        # names by table, for the table set when they were recorded
+        self.current = {}
+        self.tables = {}
+        self.table = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def record(self, path, content):
+        """
+        Record ``content`` as the artifact at ``path``. Returns False when
+        the previous run wrote the same content there.
+        """
+        name = os.path.relpath(path, self.root)
+        digest = hashlib.sha1(content).hexdigest()
+        self.current[name] = digest
+        if self.table is not None:
+            self.tables.setdefault(self.table, []).append(name)
+        return not (self.previous.get(name) == digest and
+                    os.path.exists(path))
+
+    def write(self, path, content):
+        """
+        Write ``content`` to ``path`` unless the previous run wrote the same
+        content there.
+        """
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        if not self.record(path, content):
+            return
+        makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def keep(self, table):
+        """
+        Carry the artifacts of ``table`` over from the previous run as they
+        are. Returns their names.
+        """
+        names = self.previous_tables.get(table, [])
+        for name in names:
+            self.current[name] = self.previous[name]
+        if names:
+            self.tables[table] = names
+        return names
+
+    def changes(self):
+        added = sorted(n for n in self.current if n not in self.previous)
+        changed = sorted(n for n in self.current if n in self.previous and
+                         self.current[n] != self.previous[n])
+        removed = sorted(n for n in self.previous if n not in self.current)
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+    def remove_stale(self):
+        # artifacts of the previous run this one did not produce, and the
+        # directories they leave empty
+        for name in self.changes()['removed']:
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                os.remove(path)
+            directory = os.path.dirname(path)
+            if (os.path.normpath(directory) != os.path.normpath(self.root)
+                    and os.path.isdir(directory)
+                    and not os.listdir(directory)):
+                os.rmdir(directory)
+
+    def save(self):
+        """
+        Write the manifest and the list of changes since the previous run.
+        """
+        makedirs(self.root)
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({
+                'start_date': self.start_date,
+                'bundled': self.bundled,
+                'artifacts': self.current,
+                'tables': self.tables
+            }, indent=4, sort_keys=True))
+        changes = self.changes()
+        with open(os.path.join(self.root, CHANGES), 'w') as f:
+            f.write(json.dumps(changes, indent=4))
+        return changes
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# Per partition import plans for partitioned source tables.
+#
+# Partitioned tables can be imported as one job per partition or per group
+# of consecutive partitions instead of one job for the whole table. Range
+# partitions whose upper bound lies far enough in the past no longer change,
+# they are kept in groups of their own that only need importing once.
+
+import re
+from datetime import datetime
+
+# upper bound of a DATE / TIMESTAMP range partition, e.g.
+# TO_DATE(' 2017-01-01 00:00:00', 'SYYYY-MM-DD HH24:MI:SS', ...)
+# TIMESTAMP' 2017-01-01 00:00:00'
+HIGH_VALUE_DATE = re.compile(
+    r"(?:TO_DATE\(|TIMESTAMP)\s*'\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+
+
+def partition_end(high_value):
+    match = HIGH_VALUE_DATE.search(high_value or '')
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S')
+
+
+def _group(name, partitions, frozen):
+    sizes = [p['estimated_size'] for p in partitions
+             if p['estimated_size'] is not None]
+    rows = [p['num_rows'] for p in partitions if p['num_rows'] is not None]
+    return {
+        'name': name,
+        'partitions': [p['name'] for p in partitions],
+        'estimated_size': sum(sizes) if sizes else None,
+        'num_rows': sum(rows) if rows else None,
+        'frozen': frozen
+    }
+
+
+def plan_partitions(table, mode, group_size=None, frozen_before=None):
+    """
+    Split a partitioned table into import groups. ``mode`` is either
+    ``partition`` (one group per partition) or ``group`` (consecutive
+    partitions packed into groups of up to ``group_size`` bytes). Range
+    partitions ending before ``frozen_before`` are marked frozen and never
+    share a group with partitions that still change.
+
+    Returns None for tables that are not partitioned.
+    """
+    partitioning = table.get('partitioning')
+    if not partitioning or not partitioning['partitions']:
+        return None
+
+    def is_frozen(partition):
+        if frozen_before is None or partitioning['type'] != 'RANGE':
+            return False
+        end = partition_end(partition['high_value'])
+        return end is not None and end <= frozen_before
+
+    if mode == 'partition':
+        return [_group(p['name'], [p], is_frozen(p))
+                for p in partitioning['partitions']]
+
+    groups = []
+    current = []
+    current_size = 0
+    for p in partitioning['partitions']:
+        frozen = is_frozen(p)
+        size = p['estimated_size'] or 0
+        if current and (frozen != is_frozen(current[0]) or
+                        (group_size and current_size + size > group_size)):
+            groups.append(_group('G%04d' % len(groups), current,
+                                 is_frozen(current[0])))
+            current = []
+            current_size = 0
+        current.append(p)
+        current_size += size
+    if current:
+        groups.append(_group('G%04d' % len(groups), current,
+                             is_frozen(current[0])))
+    return groups
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Mapper planning for sqoop imports.
+#
+# The time a single mapper would need to move a table is estimated from its
+# size, row count and column types together with the throughput a source
+# sustains per mapper. The mapper count is then the smallest one that brings
+# the import under the target duration, capped by the number of sessions
+# the source can take.
+
+import math
+
+# per mapper throughput and limits, overridable per source with a
+# [throughput:<SOURCE>] section in generator.cfg
+THROUGHPUT_DEFAULTS = {
+    # MB/s a mapper moves with OraOop direct mode and over plain JDBC
+    'direct_mb_per_sec': 20.0,
+    'jdbc_mb_per_sec': 5.0,
+    # fixed cost per row (fetch, conversion, parquet write) in microseconds
+    'row_overhead_us': 5.0,
+    # LOBs are fetched with extra round trips per row and are not read
+    # through the direct path, slowing the whole import down
+    'lob_factor': 4.0,
+    'target_minutes': 15.0,
+    'min_mappers': 2,
+    'max_sessions': 25,
+}
+
+LOB_TYPES = ['CLOB', 'NCLOB', 'BLOB', 'BFILE', 'LONG', 'LONG RAW', 'XMLTYPE']
+
+MB = 1024 * 1024
+
+
+def get_throughput(cfg, source):
+    figures = THROUGHPUT_DEFAULTS.copy()
+    section = 'throughput:%s' % source
+    if cfg.has_section(section):
+        for key, default in THROUGHPUT_DEFAULTS.items():
+            if cfg.has_option(section, key):
+                figures[key] = type(default)(cfg.get(section, key))
+    return figures
+
+
+def plan_mappers(table, direct, throughput):
+    """
+    Pick the mapper count for a profiled table. Returns ``(mapper, plan)``
+    where ``plan`` holds the figures the decision was based on and a list
+    of human readable ``reasons`` for auditing.
+    """
+    reasons = []
+    num_rows = table.get('num_rows')
+    size = table.get('estimated_size')
+    if size is None and num_rows is not None and table.get('avg_row_len'):
+        size = num_rows * table['avg_row_len']
+
+    lobs = [c['field'] for c in table['columns'] if c['type'] in LOB_TYPES]
+    rate = throughput['direct_mb_per_sec' if direct else 'jdbc_mb_per_sec']
+    target = throughput['target_minutes'] * 60
+
+    if size is None:
+        seconds = None
+        mapper = throughput['min_mappers']
+        reasons.append('no size estimate, using the minimum of %d mappers'
+                       % mapper)
+    else:
+        seconds = size / (rate * MB)
+        reasons.append('%.1f MB at %.1f MB/s per %s mapper: %.0fs' % (
+            size / float(MB), rate, 'direct' if direct else 'jdbc', seconds))
+        if num_rows:
+            row_seconds = num_rows * throughput['row_overhead_us'] / 1e6
+            seconds += row_seconds
+            reasons.append('%d rows at %.1fus per row: +%.0fs' % (
+                num_rows, throughput['row_overhead_us'], row_seconds))
+        if lobs:
+            seconds *= throughput['lob_factor']
+            reasons.append('LOB columns %s: x%.1f' % (
+                ','.join(lobs), throughput['lob_factor']))
+        mapper = int(math.ceil(seconds / target)) or 1
+        reasons.append('%.0fs on one mapper against a %.0f minute target: '
+                       '%d mappers' % (seconds, target / 60, mapper))
+        if mapper < throughput['min_mappers']:
+            mapper = throughput['min_mappers']
+            reasons.append('raised to the minimum of %d mappers' % mapper)
+
+    if mapper > throughput['max_sessions']:
+        mapper = throughput['max_sessions']
+        reasons.append('capped at %d source sessions' % mapper)
+
+    plan = {
+        'estimated_size': size,
+        'num_rows': num_rows,
+        'lob_columns': lobs,
+        'direct': direct,
+        'single_mapper_seconds': seconds,
+        'mapper': mapper,
+        'estimated_seconds': (seconds / mapper
+                              if seconds is not None else None),
+        'reasons': reasons,
+    }
+    return mapper, plan
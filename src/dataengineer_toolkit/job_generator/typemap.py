@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Column type mapping for sqoop imports.
+#
+# Sqoop reads NUMBER as java.math.BigDecimal, which ends up as a string in
+# the Parquet / Avro output, and dates as timestamps. From the precision and
+# scale the profiler records, every column gets the narrowest Java type
+# that still holds all of its values, for --map-column-java, and the Hive
+# type matching what sqoop then writes. Fractional NUMBERs keep BigDecimal,
+# as a double does not hold decimal fractions exactly, and are DECIMAL(p,s)
+# in Hive.
+
+# Java type sqoop writes to Avro / Parquet, and the Hive type reading it
+HIVE_TYPES = {
+    'Integer': 'INT',
+    'Long': 'BIGINT',
+    'Float': 'FLOAT',
+    'Double': 'DOUBLE',
+    'Boolean': 'BOOLEAN',
+    'String': 'STRING',
+}
+
+# decimal digits that fit in a java int / long, and in a Hive DECIMAL
+INTEGER_DIGITS = 9
+LONG_DIGITS = 18
+DECIMAL_DIGITS = 38
+
+# types read with a java type we keep, as the Hive type it becomes
+DEFAULT_HIVE_TYPES = {
+    'RAW': 'BINARY',
+    'LONG RAW': 'BINARY',
+    'BLOB': 'BINARY',
+    'bytea': 'BINARY',
+}
+
+POSTGRES_TYPES = {
+    'smallint': 'Integer',
+    'integer': 'Integer',
+    'bigint': 'Long',
+    'real': 'Float',
+    'double precision': 'Double',
+    'boolean': 'Boolean',
+}
+
+
+def _number_type(precision, scale):
+    # None keeps BigDecimal for the columns no primitive holds exactly
+    if precision is None:
+        # NUMBER without precision, or INTEGER, has up to 38 digits
+        return None
+    scale = scale or 0
+    if scale > 0:
+        return None
+    # a negative scale rounds to the left of the decimal point
+    digits = precision - scale
+    if digits <= INTEGER_DIGITS:
+        return 'Integer'
+    if digits <= LONG_DIGITS:
+        return 'Long'
+    return None
+
+
+def java_type(column):
+    """
+    Java type to import ``column``, a column of a profiled table, as with
+    --map-column-java, or None to keep the type sqoop picks.
+    """
+    data_type = column['type']
+    if data_type in ('NUMBER', 'numeric'):
+        return _number_type(column.get('precision'), column.get('scale'))
+    if data_type == 'FLOAT':
+        # FLOAT precision is in binary digits, 49 of them make the 15
+        # decimal digits a double keeps
+        precision = column.get('precision')
+        if precision is not None and precision <= 49:
+            return 'Double'
+        return None
+    if data_type == 'BINARY_FLOAT':
+        return 'Float'
+    if data_type == 'BINARY_DOUBLE':
+        return 'Double'
+    if data_type == 'DATE' or data_type.startswith('TIMESTAMP'):
+        return 'String'
+    if data_type == 'date' or data_type.startswith('timestamp'):
+        return 'String'
+    if data_type in POSTGRES_TYPES:
+        return POSTGRES_TYPES[data_type]
+    return None
+
+
+def hive_type(column):
+    """
+    Hive type of ``column`` as imported with ``java_type(column)``.
+    """
+    java = java_type(column)
+    if java is not None:
+        return HIVE_TYPES[java]
+    precision = column.get('precision')
+    if column['type'] in ('NUMBER', 'numeric') and precision is not None:
+        scale = column.get('scale') or 0
+        # NUMBER(p, s) may have a scale above its precision, or below zero
+        digits = max(precision - min(scale, 0), scale)
+        if digits <= DECIMAL_DIGITS:
+            return 'DECIMAL(%d,%d)' % (digits, max(scale, 0))
+    return DEFAULT_HIVE_TYPES.get(column['type'], 'STRING')